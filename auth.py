@@ -1,49 +1,7 @@
 import streamlit as st
 from typing import Optional
 
-# User credentials - In production, use proper authentication
-CREDENTIALS = {
-    "authority_user": "password123",
-    "normal_user": "userpass",
-    "admin": "admin123",
-    "traffic_controller": "traffic456"
-}
-
-# User roles and permissions
-USER_ROLES = {
-    "authority_user": {
-        "role": "authority",
-        "permissions": ["view_all", "modify_settings", "export_data"]
-    },
-    "admin": {
-        "role": "authority", 
-        "permissions": ["view_all", "modify_settings", "export_data", "user_management"]
-    },
-    "normal_user": {
-        "role": "user",
-        "permissions": ["view_basic"]
-    },
-    "traffic_controller": {
-        "role": "controller",
-        "permissions": ["view_all", "modify_signals"]
-    }
-}
-
-def authenticate_user(username: str, password: str) -> bool:
-    """Authenticate user credentials"""
-    return username in CREDENTIALS and CREDENTIALS[username] == password
-
-def get_user_role(username: str) -> Optional[str]:
-    """Get user role from username"""
-    if username in USER_ROLES:
-        return USER_ROLES[username]["role"]
-    return None
-
-def get_user_permissions(username: str) -> list:
-    """Get user permissions from username"""
-    if username in USER_ROLES:
-        return USER_ROLES[username]["permissions"]
-    return []
+from auth_config import authenticate_user, get_user_permissions, get_user_role
 
 def login() -> Optional[str]:
     """Handle user authentication and return user role"""
@@ -1,12 +1,12 @@
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from ultralytics import YOLO
 import cv2
 import threading
 import time
-import random
+import asyncio
 import uvicorn
 import os
 import sqlite3
@@ -14,10 +14,23 @@ import hashlib
 import jwt
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, Dict, List
-from pydantic import BaseModel
+from typing import Optional, Dict, List, NamedTuple, Tuple
+from pydantic import BaseModel, Field
 import numpy as np
 import math
+from traffic_analytics import (AnomalyDetector, CentroidTracker, FlowCounter, HoltForecaster, QueueMonitor,
+                               SaturationFlowEstimator)
+from metrics_store import MetricsHistory, MetricsWriter, load_camera_metrics, SAMPLE_FIELDS
+from functools import partial
+from data_export import EXPORT_FORMATS, TABLE_SCHEMAS, export_camera_metrics, export_table
+from pipeline_metrics import PIPELINE_STAGES, Registry, StageProfiler, TimedConnection
+from metrics_feed import MetricsBroadcaster, MetricsPublisher
+from signal_control import (GREEN, SignalPhaseScheduler, batch_signal_timing, corridor_plans, optimize_corridor,
+                            webster_timing)
+from traffic_sim import generate_arrivals, simulate
+from auth_config import authenticate_user, get_user_permissions, get_user_role
+from geo import CameraSpatialIndex, haversine_km
+from routing import RoadGraph, load_road_graph
 
 # Initialize FastAPI app
 app = FastAPI(title="Smart Traffic Management API with EcoCoin & GPS", version="3.2.0")
@@ -58,6 +71,19 @@ video_paths = [
 vehicle_names = ["car", "motorbike", "bus", "truck"]
 vehicle_emission = {"car": 0.34, "motorbike": 0.15, "bus": 1.0, "truck": 1.5}
 
+# Passenger car unit (PCU) factors used to weight each vehicle class
+PCU_FACTORS = {"car": 1.0, "motorbike": 0.5, "bus": 3.0, "truck": 3.0}
+
+# Per-class [pcu, emission] rows so both loads come from a single product with the class counts
+class_weights = np.array([[PCU_FACTORS[name], vehicle_emission[name]] for name in vehicle_names])
+
+# Maps YOLO class ids to indices into vehicle_names (-1 for non-vehicle classes)
+vehicle_class_lookup = np.full(max(model.names) + 1 if model is not None else 1, -1, dtype=np.int64)
+if model is not None:
+    for cls_id, cls_name in model.names.items():
+        if cls_name.lower() in vehicle_names:
+            vehicle_class_lookup[cls_id] = vehicle_names.index(cls_name.lower())
+
 TRAFFIC_THRESHOLDS = {
     "low": 8,
     "medium": 20,
@@ -66,13 +92,27 @@ TRAFFIC_THRESHOLDS = {
 
 BOTTLENECK_THRESHOLD = 25
 
+# Travel-time multipliers for road edges around a camera, by its live density label (set by vehicle count);
+# a bottleneck overrides the label
+CONGESTION_MULTIPLIERS = {"Low": 1.0, "Medium": 1.4, "High": 2.0}
+BOTTLENECK_MULTIPLIER = 3.0
+
 SIGNAL_CONFIG = {
     "min_green": 20,
     "max_green": 60,
     "base_green": 30,
     "red_time": 25,
+    "amber_time": 3,
+    # Webster policy: lost time per phase, assumed cross-street flow ratio and cycle bounds
+    "lost_time_per_phase": 4,
+    "cross_flow_ratio": 0.25,
+    "min_cycle": 45,
+    "max_cycle": 120,
     "vehicle_increment": 1.5,
-    "max_waiting_penalty": 15
+    "max_waiting_penalty": 15,
+    "forecast_horizon": 60,
+    "forecast_weight": 0.5,
+    "max_forecast_extension": 10
 }
 
 # EcoCoin Configuration - FIXED: Removed automatic generation based on metrics
@@ -113,6 +153,77 @@ CAMERA_LOCATIONS = {
     2: {"lat": 28.6304, "lng": 77.2177, "name": "CP Metro Station", "address": "Rajiv Chowk, New Delhi"}
 }
 
+# Spatial index over CAMERA_LOCATIONS; call rebuild_camera_index() whenever the camera set changes
+camera_index = CameraSpatialIndex(CAMERA_LOCATIONS)
+
+def rebuild_camera_index():
+    global camera_index
+    camera_index = CameraSpatialIndex(CAMERA_LOCATIONS)
+
+# Junctions coordinated as a green wave, listed in corridor order. Counting lines on these cameras
+# should be drawn so that "forward" crossings travel in corridor order
+CORRIDORS = {
+    "connaught_place": {"cameras": [1, 2], "speed_kmh": 30}
+}
+
+# Timing policy per camera: "smart" (calculate_smart_signal_timing, the default) or "webster"
+SIGNAL_POLICIES = {
+    1: "smart",
+    2: "webster"
+}
+
+# Virtual counting lines per camera, in normalized (0-1) frame coordinates
+COUNTING_LINES = {
+    1: [{"name": "main_approach", "p1": (0.05, 0.6), "p2": (0.95, 0.6)}],
+    2: [{"name": "main_approach", "p1": (0.05, 0.6), "p2": (0.95, 0.6)}]
+}
+FLOW_WINDOW_SECONDS = 60
+
+# Counting line and direction of the approach each camera's signal serves. Webster's flow ratio and the
+# saturation-flow estimator only count crossings on it; cameras without one fall back to all lines.
+# On a left-to-right line, "reverse" is downward in the frame: towards the camera and into the lane polygon
+SIGNAL_APPROACHES = {
+    1: ("main_approach", "reverse"),
+    2: ("main_approach", "reverse")
+}
+
+# Seconds ahead that the per-camera PCU load is forecast; SIGNAL_CONFIG["forecast_horizon"] must be one of them
+FORECAST_HORIZONS = (30, 60, 90, 120)
+
+# Lane/approach polygons per camera (normalized coordinates) used for queue length and waiting time
+LANE_POLYGONS = {
+    1: [{"name": "main_approach", "points": [(0.05, 0.6), (0.95, 0.6), (0.95, 1.0), (0.05, 1.0)]}],
+    2: [{"name": "main_approach", "points": [(0.05, 0.6), (0.95, 0.6), (0.95, 1.0), (0.05, 1.0)]}]
+}
+
+# Per-camera raw history: 6 hours at up to 4 samples/s in a fixed-size ring buffer (rollups keep longer ranges)
+HISTORY_CAPACITY = 6 * 3600 * 4
+
+# Closed 1 s buckets are persisted here by a background writer and reloaded on startup
+METRICS_DB_PATH = 'traffic_metrics.db'
+HISTORY_RESTORE_SECONDS = 6 * 3600
+
+# Upper bounds for /api/simulate so one request cannot occupy a worker for minutes
+MAX_SIMULATION_HOURS = 48
+MAX_DEMAND_SCALE = 10
+
+# Local OSM extract for /api/route, overridable with the ROAD_GRAPH_PATH environment variable; compiled to
+# <path>.npz on first load (see routing.py and the README). Without it /api/route answers 503 and the dashboard
+# falls back to the public OSRM server
+ROAD_GRAPH_PATH = Path(os.environ.get("ROAD_GRAPH_PATH", BASE_DIR / "road_network.osm"))
+road_graph: Optional[RoadGraph] = None
+
+# Internal pipeline metrics exposed at /internal/metrics
+pipeline_registry = Registry()
+camera_fps = pipeline_registry.gauge("traffic_camera_fps", "Frames processed per second", ("camera",))
+frames_processed = pipeline_registry.counter("traffic_frames_processed_total", "Frames processed", ("camera",))
+frames_dropped = pipeline_registry.counter("traffic_frames_dropped_total", "Frames dropped due to processing errors", ("camera",))
+inference_seconds = pipeline_registry.histogram("traffic_inference_seconds", "YOLO inference latency", ("camera",))
+jpeg_encode_seconds = pipeline_registry.histogram("traffic_jpeg_encode_seconds", "JPEG encode latency for streams", ("camera",))
+stream_clients = pipeline_registry.gauge("traffic_stream_clients", "Active MJPEG stream clients", ("camera",))
+db_query_seconds = pipeline_registry.histogram("traffic_db_query_seconds", "SQLite query latency", ("endpoint",))
+DECODE, RESIZE, INFERENCE, POSTPROCESS, DRAW, METRICS, ENCODE, CAPTURE_TO_METRICS = range(len(PIPELINE_STAGES))
+
 # Pydantic Models
 class UserRegistration(BaseModel):
     username: str
@@ -134,6 +245,13 @@ class TripData(BaseModel):
     transport_mode: str
     route_efficiency: float = 1.0
 
+class SimulationRequest(BaseModel):
+    camera_id: int
+    hours: float = Field(24, gt=0, le=MAX_SIMULATION_HOURS)
+    policies: List[str] = ["smart", "fixed"]
+    demand_scale: float = Field(1.0, gt=0, le=MAX_DEMAND_SCALE)
+    seed: int = 0
+
 class RouteRequest(BaseModel):
     start_lat: float
     start_lng: float
@@ -141,6 +259,8 @@ class RouteRequest(BaseModel):
     end_lng: float
     start_address: str = ""
     end_address: str = ""
+    polyline: Optional[List[Tuple[float, float]]] = None  # [lat, lng] route vertices, start to end
+    route_buffer_km: Optional[float] = None
 
 class EcoCoinTransaction(BaseModel):
     user_id: int
@@ -150,27 +270,117 @@ class EcoCoinTransaction(BaseModel):
     service_type: Optional[str] = None
 
 # Enhanced Global variables
+class MetricsSnapshot(NamedTuple):
+    """Immutable per-camera metrics; the processing thread publishes a new one with a single reference swap"""
+    vehicles: int
+    class_counts: Tuple[int, ...]  # ordered like vehicle_names
+    pcu: float
+    status: str
+    signal_time: int
+    waiting_time: int
+    queue_length: int
+    lanes: Dict  # built fresh for each snapshot and never mutated after publish
+    co2: float
+    bottleneck: str
+    last_update: float
+    detection_confidence: float
+    flow: Dict  # same as lanes
+    forecast: Dict  # predicted PCU load keyed by horizon in seconds
+    signal_plan: Dict  # coordinated cycle, green and offset when the camera is on a corridor
+
+    def to_dict(self) -> Dict:
+        data = self._asdict()
+        data["class_counts"] = dict(zip(vehicle_names, self.class_counts))
+        return data
+
 class LocationMetrics:
-    def __init__(self):
-        self.vehicles = 0
-        self.status = "Low"
-        self.signal_time = SIGNAL_CONFIG["base_green"]
-        self.waiting_time = 0
-        self.co2 = 0.0
-        self.bottleneck = "No"
+    """Per-camera state: the published snapshot plus objects owned by the camera's processing thread"""
+    __slots__ = ("camera_id", "snapshot", "history", "signal_cycle_start", "is_green_phase", "signal_plan", "red_time",
+                 "saturation", "approach",
+                 "tracker", "flow_counter", "queue_monitor", "profiler", "anomaly_detector")
+
+    def __init__(self, camera_id: int):
+        self.camera_id = camera_id
         # REMOVED: ecocoins_generated - no longer auto-generated
-        self.vehicle_history = []
-        self.last_update = time.time()
-        self.detection_confidence = 0.0
+        self.history = MetricsHistory(HISTORY_CAPACITY, len(vehicle_names),
+                                      sink=partial(metrics_writer.submit, camera_id))
         self.signal_cycle_start = time.time()
         self.is_green_phase = True
+        self.signal_plan = {}  # replaced wholesale by the corridor coordinator
+        self.red_time = SIGNAL_CONFIG["red_time"]
+        self.saturation = SaturationFlowEstimator()
+        self.tracker = CentroidTracker()
+        self.flow_counter = FlowCounter(COUNTING_LINES.get(camera_id, []), vehicle_names, FLOW_WINDOW_SECONDS)
+        self.queue_monitor = QueueMonitor(LANE_POLYGONS.get(camera_id, []))
+        approach = SIGNAL_APPROACHES.get(camera_id)
+        self.approach = self.flow_counter.approach(*approach) if approach else None
+        self.profiler = StageProfiler()
+        self.anomaly_detector = AnomalyDetector()
+        self.snapshot = MetricsSnapshot(
+            vehicles=0,
+            class_counts=(0,) * len(vehicle_names),
+            pcu=0.0,
+            status="Low",
+            signal_time=SIGNAL_CONFIG["base_green"],
+            waiting_time=0,
+            queue_length=0,
+            lanes={},
+            co2=0.0,
+            bottleneck="No",
+            last_update=time.time(),
+            detection_confidence=0.0,
+            flow=self.flow_counter.flow_rates(),
+            forecast={},
+            signal_plan={}
+        )
 
 # Initialize location metrics
-location_metrics = [LocationMetrics() for _ in video_paths]
+metrics_writer = MetricsWriter(METRICS_DB_PATH, vehicle_names)
+pipeline_registry.gauge_callback("traffic_queue_depth", "Items waiting in internal queues", ("queue",),
+                                 lambda: {("metrics_writer",): metrics_writer.depth()})
+location_metrics = [LocationMetrics(i + 1) for i in range(len(video_paths))]
+load_forecaster = HoltForecaster(len(location_metrics), FORECAST_HORIZONS)
+metrics_publisher = MetricsPublisher(len(location_metrics))
+for i, location in enumerate(location_metrics):
+    metrics_publisher.publish(i, location.snapshot.to_dict())
+metrics_broadcaster = MetricsBroadcaster(metrics_publisher)
+
+# A corridor plan overrides the camera's own policy (smart or Webster) for green, red and cycle start alike,
+# so corridor junctions run exactly the plan's cycle and offsets
+def next_green_time(idx: int) -> float:
+    """Green for the cycle about to start: the corridor plan if there is one, else the camera's recommendation"""
+    location = location_metrics[idx]
+    return location.signal_plan.get("green", location.snapshot.signal_time)
+
+def next_red_time(idx: int) -> float:
+    """Red for junctions outside any corridor; corridor junctions get theirs from signal_anchor"""
+    return location_metrics[idx].red_time
+
+def signal_anchor(idx: int) -> Optional[Tuple[float, float]]:
+    plan = location_metrics[idx].signal_plan
+    if "green_start" not in plan:
+        return None
+    return plan["green_start"], plan["cycle"]
+
+def record_signal_phase(idx: int, phase: int, started_at: float):
+    location = location_metrics[idx]
+    location.is_green_phase = phase == GREEN
+    if phase == GREEN:
+        location.signal_cycle_start = started_at
+
+signal_scheduler = SignalPhaseScheduler(len(location_metrics), next_green_time, SIGNAL_CONFIG["amber_time"],
+                                        next_red_time, on_phase=record_signal_phase, anchor=signal_anchor,
+                                        min_red=SIGNAL_CONFIG["amber_time"])
 yield_frame = [None for _ in video_paths]
 processing_threads = []
 
 # Database functions
+def db_connect(endpoint: str) -> sqlite3.Connection:
+    """Open the EcoCoin database with query latency recorded under the calling endpoint"""
+    conn = sqlite3.connect('ecocoin_system.db', factory=TimedConnection)
+    conn.query_latency = db_query_seconds.labels(endpoint)
+    return conn
+
 def init_database():
     conn = sqlite3.connect('ecocoin_system.db')
     cursor = conn.cursor()
@@ -246,12 +456,15 @@ init_database()
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
-def create_jwt_token(user_id: int, username: str) -> str:
+def create_jwt_token(user_id: Optional[int], username: str, role: Optional[str] = None) -> str:
     payload = {
         "user_id": user_id,
         "username": username,
         "exp": datetime.utcnow() + timedelta(hours=24)
     }
+    # Only dashboard staff tokens (see /api/staff-login) carry a role; citizen tokens never do
+    if role is not None:
+        payload["role"] = role
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 def verify_jwt_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
@@ -263,6 +476,14 @@ def verify_jwt_token(credentials: HTTPAuthorizationCredentials = Depends(securit
     except jwt.JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def require_staff_permission(permission: str):
+    """Dependency admitting only staff tokens whose auth.py account holds the given permission"""
+    def check(user_data: dict = Depends(verify_jwt_token)) -> dict:
+        if user_data.get("role") is None or permission not in get_user_permissions(user_data["username"]):
+            raise HTTPException(status_code=403, detail=f"'{permission}' permission required")
+        return user_data
+    return check
+
 def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
     """Calculate distance between two points using Haversine formula"""
     R = 6371  # Earth's radius in kilometers
@@ -362,32 +583,40 @@ def calculate_co2_savings(distance_km: float, transport_mode: str) -> float:
     
     return co2_saved
 
-def get_cameras_on_route(start_lat: float, start_lng: float, end_lat: float, end_lng: float, radius: float = 10.0) -> List[Dict]:
-    """Get cameras within radius of the route"""
+def get_cameras_on_route(start_lat: float, start_lng: float, end_lat: float, end_lng: float, radius: float = 10.0,
+                         polyline: Optional[List[Tuple[float, float]]] = None) -> List[Dict]:
+    """Get cameras within radius of the route, ordered along it"""
     cameras_on_route = []
-    
-    for camera_id, camera_info in CAMERA_LOCATIONS.items():
-        start_distance = calculate_distance(start_lat, start_lng, camera_info["lat"], camera_info["lng"])
-        end_distance = calculate_distance(end_lat, end_lng, camera_info["lat"], camera_info["lng"])
-        
-        # Check if camera is on route (within radius of start, end, or route path)
-        if start_distance <= radius or end_distance <= radius:
-            if camera_id - 1 < len(location_metrics):
-                current_metrics = location_metrics[camera_id - 1]
-                camera_data = {
-                    "id": camera_id,
-                    "lat": camera_info["lat"],
-                    "lng": camera_info["lng"],
-                    "name": camera_info["name"],
-                    "address": camera_info["address"],
-                    "traffic_status": current_metrics.status,
-                    "vehicle_count": current_metrics.vehicles,
-                    "signal_time": current_metrics.signal_time,
-                    "bottleneck": current_metrics.bottleneck == "Yes",
-                    "distance_from_start": round(start_distance, 2),
-                    "distance_from_end": round(end_distance, 2)
-                }
-                cameras_on_route.append(camera_data)
+    index = camera_index
+    
+    # Without the road geometry, the straight line between the endpoints stands in for the route
+    path = np.asarray(polyline if polyline else [(start_lat, start_lng), (end_lat, end_lng)], dtype=np.float64)
+    rows, route_distances, along = index.near_polyline(path[:, 0], path[:, 1], radius)
+    start_distances = haversine_km(start_lat, start_lng, index.lat[rows], index.lng[rows])
+    end_distances = haversine_km(end_lat, end_lng, index.lat[rows], index.lng[rows])
+    
+    for row, start_distance, end_distance, route_distance, distance_along in zip(
+            rows, start_distances, end_distances, route_distances, along):
+        camera_id = int(index.ids[row])
+        camera_info = CAMERA_LOCATIONS[camera_id]
+        if camera_id - 1 < len(location_metrics):
+            current_metrics = location_metrics[camera_id - 1].snapshot
+            camera_data = {
+                "id": camera_id,
+                "lat": camera_info["lat"],
+                "lng": camera_info["lng"],
+                "name": camera_info["name"],
+                "address": camera_info["address"],
+                "traffic_status": current_metrics.status,
+                "vehicle_count": current_metrics.vehicles,
+                "signal_time": current_metrics.signal_time,
+                "bottleneck": current_metrics.bottleneck == "Yes",
+                "distance_from_start": round(float(start_distance), 2),
+                "distance_from_end": round(float(end_distance), 2),
+                "distance_from_route": round(float(route_distance), 2),
+                "distance_along_route": round(float(distance_along), 2)
+            }
+            cameras_on_route.append(camera_data)
     
     return cameras_on_route
 
@@ -441,47 +670,76 @@ def get_density_label(count):
     else:
         return "High"
 
-def calculate_smart_signal_timing(vehicle_count: int, current_waiting_time: int, traffic_history: list) -> Dict:
+def congestion_multiplier(snapshot: MetricsSnapshot) -> float:
+    """Factor by which a camera's live traffic slows the road edges around it"""
+    if snapshot.bottleneck == "Yes":
+        return BOTTLENECK_MULTIPLIER
+    return CONGESTION_MULTIPLIERS.get(snapshot.status, 1.0)
+
+def estimate_co2_reduction(green_time: int, cycle_time: float, vehicle_count: int, load: float,
+                           emission_load: Optional[float] = None) -> Tuple[float, float]:
+    """CO2 saved by a timing plan and its green/cycle efficiency ratio, both unrounded"""
+    efficiency_ratio = green_time / cycle_time
+    
+    base_emission_per_vehicle = 0.08
+    efficiency_factor = min(efficiency_ratio * 1.2, 1.0)
+    if emission_load is None:
+        vehicle_co2 = vehicle_count * base_emission_per_vehicle
+    else:
+        # Scale class emissions so a car keeps the per-vehicle baseline
+        vehicle_co2 = emission_load * base_emission_per_vehicle / vehicle_emission["car"]
+    co2_reduction = vehicle_co2 * efficiency_factor
+    
+    if load > 10 and green_time < SIGNAL_CONFIG["max_green"]:
+        co2_reduction *= 1.1
+    
+    return co2_reduction, efficiency_ratio
+
+def calculate_smart_signal_timing(vehicle_count: int, current_waiting_time: int, traffic_history: list,
+                                  pcu_load: Optional[float] = None, emission_load: Optional[float] = None,
+                                  forecast_load: Optional[float] = None) -> Dict:
+    """Green time from traffic load; pcu_load and emission_load replace the raw count when class data is known"""
     base_green = SIGNAL_CONFIG["base_green"]
     min_green = SIGNAL_CONFIG["min_green"]
     max_green = SIGNAL_CONFIG["max_green"]
     vehicle_increment = SIGNAL_CONFIG["vehicle_increment"]
+    load = vehicle_count if pcu_load is None else pcu_load
     
-    if vehicle_count == 0:
+    if load == 0:
         green_time = min_green
-        waiting_time = max(0, current_waiting_time - 2)
-    elif vehicle_count <= 5:
+    elif load <= 5:
         green_time = base_green
-        waiting_time = max(0, current_waiting_time - 1)
-    elif vehicle_count <= 15:
-        extra_time = (vehicle_count - 5) * vehicle_increment
+    elif load <= 15:
+        extra_time = (load - 5) * vehicle_increment
         green_time = base_green + extra_time
-        waiting_time = current_waiting_time + random.randint(0, 2)
     else:
         extra_time = 10 * vehicle_increment
-        waiting_penalty = min((vehicle_count - 15) * 0.5, SIGNAL_CONFIG["max_waiting_penalty"])
+        waiting_penalty = min((load - 15) * 0.5, SIGNAL_CONFIG["max_waiting_penalty"])
         green_time = base_green + extra_time + waiting_penalty
-        waiting_time = current_waiting_time + random.randint(2, 4)
     
+    # current_waiting_time is measured from queue dwell; queues that outlast a red phase get extra green
+    if current_waiting_time > SIGNAL_CONFIG["red_time"]:
+        green_time += min((current_waiting_time - SIGNAL_CONFIG["red_time"]) * 0.5, SIGNAL_CONFIG["max_waiting_penalty"])
+    
+    # traffic_history holds the same load measure (PCU on the live path)
     if len(traffic_history) > 3:
         recent_avg = sum(traffic_history[-3:]) / 3
         if recent_avg > 0:
-            trend_factor = min(max(vehicle_count / recent_avg, 0.8), 1.2)
+            trend_factor = min(max(load / recent_avg, 0.8), 1.2)
             green_time = green_time * trend_factor
     
+    # Pre-extend green when the load forecast for the coming phase is above what is queued now
+    if forecast_load is not None and forecast_load > load:
+        green_time += min((forecast_load - load) * vehicle_increment * SIGNAL_CONFIG["forecast_weight"],
+                          SIGNAL_CONFIG["max_forecast_extension"])
+    
     green_time = max(min_green, min(green_time, max_green))
     green_time = int(green_time)
-    waiting_time = max(0, min(waiting_time, 45))
+    waiting_time = max(0, current_waiting_time)
     
     total_cycle_time = green_time + SIGNAL_CONFIG["red_time"]
-    efficiency_ratio = green_time / total_cycle_time
-    
-    base_emission_per_vehicle = 0.08
-    efficiency_factor = min(efficiency_ratio * 1.2, 1.0)
-    co2_reduction = vehicle_count * base_emission_per_vehicle * efficiency_factor
-    
-    if vehicle_count > 10 and green_time < max_green:
-        co2_reduction *= 1.1
+    co2_reduction, efficiency_ratio = estimate_co2_reduction(green_time, total_cycle_time, vehicle_count, load,
+                                                             emission_load)
     
     return {
         "signal_time": green_time,
@@ -491,6 +749,48 @@ def calculate_smart_signal_timing(vehicle_count: int, current_waiting_time: int,
         "cycle_time": total_cycle_time
     }
 
+def approach_flow(location: LocationMetrics) -> float:
+    """Vehicles per minute on the approach a camera's signal serves (all lines if none is configured)"""
+    if location.approach is None:
+        return location.flow_counter.total_flow()
+    return location.flow_counter.approach_flow(location.approach)
+
+def calculate_webster_signal_timing(vehicle_count: int, current_waiting_time: int, flow_vpm: float,
+                                    saturation_flow: float, pcu_load: Optional[float] = None,
+                                    emission_load: Optional[float] = None) -> Dict:
+    """Webster cycle and split from the measured approach flow ratio against a configured cross-street ratio"""
+    min_green = SIGNAL_CONFIG["min_green"]
+    amber_time = SIGNAL_CONFIG["amber_time"]
+    lost_per_phase = SIGNAL_CONFIG["lost_time_per_phase"]
+    load = vehicle_count if pcu_load is None else pcu_load
+    
+    flow_ratio = flow_vpm / 60.0 / saturation_flow
+    cycle, effective_greens = webster_timing(np.array([flow_ratio, SIGNAL_CONFIG["cross_flow_ratio"]]),
+                                             2 * lost_per_phase, SIGNAL_CONFIG["min_cycle"], SIGNAL_CONFIG["max_cycle"])
+    
+    # Displayed green = effective green + lost time - amber; the cross street's share becomes our red
+    green_time = int(max(min_green, min(effective_greens[0] + lost_per_phase - amber_time, SIGNAL_CONFIG["max_green"])))
+    red_time = max(cycle - green_time - amber_time, min_green)
+    total_cycle_time = green_time + amber_time + red_time
+    co2_reduction, efficiency_ratio = estimate_co2_reduction(green_time, total_cycle_time, vehicle_count, load,
+                                                             emission_load)
+    
+    return {
+        "signal_time": green_time,
+        "waiting_time": int(max(0, current_waiting_time)),
+        "co2_reduction": round(co2_reduction, 2),
+        "efficiency_ratio": round(efficiency_ratio, 2),
+        "cycle_time": round(total_cycle_time, 1),
+        "red_time": round(red_time, 1)
+    }
+
+def calculate_batch_signal_timing(vehicle_counts: np.ndarray, waiting_times: np.ndarray, histories: np.ndarray,
+                                  pcu_loads: Optional[np.ndarray] = None, emission_loads: Optional[np.ndarray] = None,
+                                  forecast_loads: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """calculate_smart_signal_timing for many junctions at once; histories are NaN-padded on the left"""
+    return batch_signal_timing(vehicle_counts, waiting_times, histories, SIGNAL_CONFIG, vehicle_emission["car"],
+                               pcu_loads, emission_loads, forecast_loads)
+
 def process_video(idx, path):
     """Video processing - no changes to detection, just removed ecocoin generation"""
     if not os.path.exists(path):
@@ -512,7 +812,17 @@ def process_video(idx, path):
     frame_count = 0
     metrics_update_interval = max(1, fps // 3)
 
+    camera_label = idx + 1
+    fps_gauge = camera_fps.labels(camera_label)
+    processed_counter = frames_processed.labels(camera_label)
+    dropped_counter = frames_dropped.labels(camera_label)
+    inference_histogram = inference_seconds.labels(camera_label)
+    fps_window_start = time.perf_counter()
+    fps_window_frames = 0
+    profiler = location_metrics[idx].profiler
+
     while True:
+        decode_start = time.perf_counter()
         ret, frame = cap.read()
         if not ret:
             cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
@@ -521,6 +831,8 @@ def process_video(idx, path):
 
         frame_count += 1
         current_time = time.time()
+        captured_at = time.perf_counter()
+        profiler.record(DECODE, captured_at - decode_start)
 
         try:
             original_height, original_width = frame.shape[:2]
@@ -530,88 +842,223 @@ def process_video(idx, path):
             new_height = int(original_height * scale)
             
             frame_resized = cv2.resize(frame, (new_width, new_height))
+            stage_start = time.perf_counter()
+            profiler.record(RESIZE, stage_start - captured_at)
             
             results = model(frame_resized, verbose=False, conf=0.25)
+            stage_end = time.perf_counter()
+            inference_histogram.observe(stage_end - stage_start)
+            profiler.record(INFERENCE, stage_end - stage_start)
+            stage_start = stage_end
             vehicle_count = 0
             total_confidence = 0
+            xyxy = np.empty((0, 4))
+            centroids = np.empty((0, 2))
+            class_idx = np.empty(0, dtype=np.int64)
 
             if results and results[0].boxes is not None and len(results[0].boxes) > 0:
                 h_ratio = original_height / new_height
                 w_ratio = original_width / new_width
 
-                for box in results[0].boxes:
-                    cls_id = int(box.cls.cpu().numpy()[0])
-                    cls_name = model.names[cls_id].lower()
-                    confidence = float(box.conf.cpu().numpy()[0])
-
-                    if cls_name in vehicle_names and confidence > 0.25:
-                        vehicle_count += 1
-                        total_confidence += confidence
-                        
-                        x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
-                        x1, x2 = int(x1 * w_ratio), int(x2 * w_ratio)
-                        y1, y2 = int(y1 * h_ratio), int(y2 * h_ratio)
-
-                        # Green bounding box, no confidence score
-                        color = (0, 255, 0)
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                        
-                        # Only show vehicle type
-                        label = f"{cls_name}"
-                        label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0]
-                        cv2.rectangle(frame, (x1, y1 - label_size[1] - 8), 
-                                    (x1 + label_size[0], y1), color, -1)
-                        cv2.putText(frame, label, (x1, y1 - 4),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+                boxes = results[0].boxes
+                xyxy = boxes.xyxy.cpu().numpy()
+                confidences = boxes.conf.cpu().numpy()
+                class_idx = vehicle_class_lookup[boxes.cls.cpu().numpy().astype(np.int64)]
+
+                keep = (class_idx >= 0) & (confidences > 0.25)
+                xyxy = xyxy[keep] * np.array([w_ratio, h_ratio, w_ratio, h_ratio])
+                class_idx = class_idx[keep]
+                vehicle_count = int(keep.sum())
+                total_confidence = float(confidences[keep].sum())
+
+                centroids = np.column_stack([
+                    (xyxy[:, 0] + xyxy[:, 2]) / (2 * original_width),
+                    (xyxy[:, 1] + xyxy[:, 3]) / (2 * original_height)
+                ])
+
+            # Track every frame so crossings are seen as continuous segments
+            track_ids, previous_positions, _ = location_metrics[idx].tracker.update(centroids, class_idx)
+            crossings = location_metrics[idx].flow_counter.update(previous_positions, centroids, class_idx, current_time)
+            queue_state = location_metrics[idx].queue_monitor.update(track_ids, previous_positions, centroids, current_time)
+            approach = location_metrics[idx].approach
+            served = (len(crossings) if approach is None else
+                      int(np.count_nonzero((crossings[:, 0] == approach[0]) & (crossings[:, 1] == approach[1]))))
+            # Learn headways from discharge the camera actually sees (queued vehicles pulling away), not from the
+            # scheduler's phase, which the traffic in the video does not follow
+            location_metrics[idx].saturation.update(current_time, served, queue_state["discharging"])
+            stage_end = time.perf_counter()
+            profiler.record(POSTPROCESS, stage_end - stage_start)
+            stage_start = stage_end
+
+            for (x1, y1, x2, y2), cls in zip(xyxy.astype(int), class_idx):
+                # Green bounding box, no confidence score
+                color = (0, 255, 0)
+                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+                
+                # Only show vehicle type
+                label = vehicle_names[cls]
+                label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0]
+                cv2.rectangle(frame, (x1, y1 - label_size[1] - 8), 
+                            (x1 + label_size[0], y1), color, -1)
+                cv2.putText(frame, label, (x1, y1 - 4),
+                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+            for line in COUNTING_LINES.get(idx + 1, []):
+                p1 = (int(line["p1"][0] * original_width), int(line["p1"][1] * original_height))
+                p2 = (int(line["p2"][0] * original_width), int(line["p2"][1] * original_height))
+                cv2.line(frame, p1, p2, (255, 200, 0), 2)
+            stage_end = time.perf_counter()
+            profiler.record(DRAW, stage_end - stage_start)
+            stage_start = stage_end
 
             if frame_count % metrics_update_interval == 0:
-                location_metrics[idx].vehicle_history.append(vehicle_count)
-                if len(location_metrics[idx].vehicle_history) > 10:
-                    location_metrics[idx].vehicle_history.pop(0)
+                class_counts = np.bincount(class_idx, minlength=len(vehicle_names))
+                pcu_load, emission_load = class_counts @ class_weights
+
+                history = location_metrics[idx].history
+                load_forecaster.update(idx, current_time, pcu_load)
+                forecast = load_forecaster.forecast(idx)
+                
+                if SIGNAL_POLICIES.get(idx + 1, "smart") == "webster":
+                    signal_data = calculate_webster_signal_timing(
+                        vehicle_count,
+                        queue_state["waiting_time"],
+                        approach_flow(location_metrics[idx]),
+                        location_metrics[idx].saturation.saturation_flow(),
+                        pcu_load=pcu_load,
+                        emission_load=emission_load
+                    )
+                else:
+                    signal_data = calculate_smart_signal_timing(
+                        vehicle_count,
+                        queue_state["waiting_time"],
+                        np.append(history.latest("pcu", 9), pcu_load),
+                        pcu_load=pcu_load,
+                        emission_load=emission_load,
+                        forecast_load=forecast[FORECAST_HORIZONS.index(SIGNAL_CONFIG["forecast_horizon"])]
+                    )
+                location_metrics[idx].red_time = signal_data.get("red_time", SIGNAL_CONFIG["red_time"])
                 
-                signal_data = calculate_smart_signal_timing(
-                    vehicle_count,
-                    location_metrics[idx].waiting_time,
-                    location_metrics[idx].vehicle_history
+                snapshot = MetricsSnapshot(
+                    vehicles=vehicle_count,
+                    class_counts=tuple(class_counts.tolist()),
+                    pcu=round(float(pcu_load), 1),
+                    status=get_density_label(vehicle_count),
+                    signal_time=signal_data["signal_time"],
+                    waiting_time=signal_data["waiting_time"],
+                    queue_length=queue_state["queue_length"],
+                    lanes=queue_state["lanes"],
+                    co2=signal_data["co2_reduction"],
+                    bottleneck="Yes" if vehicle_count >= BOTTLENECK_THRESHOLD else "No",
+                    last_update=current_time,
+                    detection_confidence=round(total_confidence / max(vehicle_count, 1), 2) if vehicle_count > 0 else 0.0,
+                    flow=location_metrics[idx].flow_counter.flow_rates(current_time),
+                    forecast={str(h): round(float(v), 1) for h, v in zip(FORECAST_HORIZONS, forecast)},
+                    signal_plan=location_metrics[idx].signal_plan
                 )
+                # Readers on other threads see either the previous snapshot or this one, never a mix
+                location_metrics[idx].snapshot = snapshot
+                metrics_publisher.publish(idx, snapshot.to_dict())
+                if road_graph is not None:
+                    road_graph.set_camera_congestion(idx + 1, congestion_multiplier(snapshot))
                 
-                location_metrics[idx].vehicles = vehicle_count
-                location_metrics[idx].status = get_density_label(vehicle_count)
-                location_metrics[idx].signal_time = signal_data["signal_time"]
-                location_metrics[idx].waiting_time = signal_data["waiting_time"]
-                location_metrics[idx].co2 = signal_data["co2_reduction"]
-                location_metrics[idx].bottleneck = "Yes" if vehicle_count >= BOTTLENECK_THRESHOLD else "No"
-                location_metrics[idx].last_update = current_time
-                location_metrics[idx].detection_confidence = round(total_confidence / max(vehicle_count, 1), 2) if vehicle_count > 0 else 0.0
+                history.append(current_time, class_counts, (
+                    vehicle_count, pcu_load, snapshot.signal_time, snapshot.waiting_time,
+                    snapshot.co2, snapshot.detection_confidence,
+                    location_metrics[idx].flow_counter.total_flow()
+                ))
+                for anomaly in location_metrics[idx].anomaly_detector.update(current_time, vehicle_count):
+                    anomaly["camera_id"] = idx + 1
+                    metrics_publisher.publish_event("anomaly", anomaly)
+                    print(f"⚠️ Camera {idx + 1} anomaly: {anomaly['kind']} ({anomaly['value']} vs {anomaly['expected']})")
+                stage_end = time.perf_counter()
+                profiler.record(METRICS, stage_end - stage_start)
+                profiler.record(CAPTURE_TO_METRICS, stage_end - captured_at)
 
             yield_frame[idx] = frame
+            processed_counter.inc()
+
+            fps_window_frames += 1
+            elapsed = time.perf_counter() - fps_window_start
+            if elapsed >= 1.0:
+                fps_gauge.set(round(fps_window_frames / elapsed, 2))
+                fps_window_start = time.perf_counter()
+                fps_window_frames = 0
 
         except Exception as e:
             print(f"❌ Error processing frame for video {idx}: {e}")
+            dropped_counter.inc()
             continue
 
         time.sleep(0.033)
 
-def generate_frames(video_idx):
+def directional_flow(flow: Dict) -> Tuple[float, float]:
+    """Forward and reverse vehicles per minute summed over a camera's counting lines"""
+    return (sum(line["forward"]["total_vpm"] for line in flow.values()),
+            sum(line["reverse"]["total_vpm"] for line in flow.values()))
+
+def coordinate_corridors():
+    """Re-solve every corridor once per common cycle and hand the plans to the camera threads"""
+    # Everything outside green, so a plan's cycle is exactly what the scheduler runs
+    red_time = SIGNAL_CONFIG["red_time"] + SIGNAL_CONFIG["amber_time"]
     while True:
+        next_solve = SIGNAL_CONFIG["base_green"] + red_time
         try:
-            frame = yield_frame[video_idx]
-            if frame is not None:
-                encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 85]
-                ret, buffer = cv2.imencode('.jpg', frame, encode_param)
-                if ret:
-                    frame_bytes = buffer.tobytes()
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            time.sleep(0.033)
+            for name, corridor in CORRIDORS.items():
+                camera_ids = corridor["cameras"]
+                snapshots = [location_metrics[camera_id - 1].snapshot for camera_id in camera_ids]
+                lats = np.array([CAMERA_LOCATIONS[camera_id]["lat"] for camera_id in camera_ids])
+                lngs = np.array([CAMERA_LOCATIONS[camera_id]["lng"] for camera_id in camera_ids])
+                distances = haversine_km(lats[:-1], lngs[:-1], lats[1:], lngs[1:]) * 1000
+                flows = np.array([directional_flow(s.flow) for s in snapshots]).reshape(-1, 2)
+                
+                plan = optimize_corridor(
+                    distances, flows[:, 0], flows[:, 1],
+                    np.array([s.signal_time for s in snapshots], dtype=np.float64),
+                    red_time, corridor["speed_kmh"],
+                    SIGNAL_CONFIG["min_green"] + red_time, SIGNAL_CONFIG["max_green"] + red_time
+                )
+                # Keep the first junction on its current cycle; the others are placed relative to it
+                epoch = float(signal_scheduler.cycle_started[camera_ids[0] - 1]) or time.time()
+                for camera_id, camera_plan in corridor_plans(name, camera_ids, plan, time.time(), epoch).items():
+                    location_metrics[camera_id - 1].signal_plan = camera_plan
+                next_solve = min(next_solve, plan["cycle"])
         except Exception as e:
-            print(f"❌ Error in frame generation for video {video_idx}: {e}")
-            time.sleep(0.1)
+            print(f"❌ Corridor coordination error: {e}")
+        
+        time.sleep(next_solve)
+
+def generate_frames(video_idx):
+    encode_histogram = jpeg_encode_seconds.labels(video_idx + 1)
+    profiler = location_metrics[video_idx].profiler
+    clients_gauge = stream_clients.labels(video_idx + 1)
+    clients_gauge.inc()
+    try:
+        while True:
+            try:
+                frame = yield_frame[video_idx]
+                if frame is not None:
+                    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 85]
+                    encode_start = time.perf_counter()
+                    ret, buffer = cv2.imencode('.jpg', frame, encode_param)
+                    encode_time = time.perf_counter() - encode_start
+                    encode_histogram.observe(encode_time)
+                    profiler.record(ENCODE, encode_time)
+                    if ret:
+                        frame_bytes = buffer.tobytes()
+                        yield (b'--frame\r\n'
+                               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                time.sleep(0.033)
+            except Exception as e:
+                print(f"❌ Error in frame generation for video {video_idx}: {e}")
+                time.sleep(0.1)
+    finally:
+        clients_gauge.dec()
 
 # API Endpoints
 @app.post("/api/register")
 def register_user(user: UserRegistration):
-    conn = sqlite3.connect('ecocoin_system.db')
+    conn = db_connect("/api/register")
     cursor = conn.cursor()
     
     try:
@@ -648,7 +1095,7 @@ def register_user(user: UserRegistration):
 
 @app.post("/api/login")
 def login_user(user: UserLogin):
-    conn = sqlite3.connect('ecocoin_system.db')
+    conn = db_connect("/api/login")
     cursor = conn.cursor()
     
     password_hash = hash_password(user.password)
@@ -674,9 +1121,23 @@ def login_user(user: UserLogin):
         "ecocoin_balance": balance
     }
 
+@app.post("/api/staff-login")
+def login_staff(user: UserLogin):
+    """Token for dashboard staff accounts from auth_config.py, carrying their role"""
+    if not authenticate_user(user.username, user.password):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    role = get_user_role(user.username)
+    return {
+        "message": "Login successful",
+        "token": create_jwt_token(None, user.username, role),
+        "username": user.username,
+        "role": role
+    }
+
 @app.get("/api/user-profile")
 def get_user_profile(user_data: dict = Depends(verify_jwt_token)):
-    conn = sqlite3.connect('ecocoin_system.db')
+    conn = db_connect("/api/user-profile")
     cursor = conn.cursor()
     
     try:
@@ -741,7 +1202,7 @@ def get_user_profile(user_data: dict = Depends(verify_jwt_token)):
 @app.post("/api/record-trip")
 def record_trip(trip: TripData, user_data: dict = Depends(verify_jwt_token)):
     """NEW: Enhanced trip recording with improved EcoCoin calculation"""
-    conn = sqlite3.connect('ecocoin_system.db')
+    conn = db_connect("/api/record-trip")
     cursor = conn.cursor()
     
     # Get estimated time for the trip based on distance and transport mode
@@ -805,18 +1266,77 @@ def record_trip(trip: TripData, user_data: dict = Depends(verify_jwt_token)):
     finally:
         conn.close()
 
+def smart_signal_policy(state: Dict) -> float:
+    """Live timing function applied to a simulated junction's queue at the start of each green"""
+    return calculate_smart_signal_timing(state["queue_length"], int(state["waiting_time"]), state["history"],
+                                         pcu_load=state["queued_pcu"])["signal_time"]
+
+SIMULATION_POLICIES = {
+    "smart": smart_signal_policy,
+    "fixed": lambda state: SIGNAL_CONFIG["base_green"],
+    "max_green": lambda state: SIGNAL_CONFIG["max_green"]
+}
+
+@app.post("/api/simulate")
+def simulate_signal_policies(request: SimulationRequest):
+    """Replay recorded arrivals for a camera through each timing policy and compare delay, queues and CO2"""
+    if not 1 <= request.camera_id <= len(location_metrics):
+        raise HTTPException(status_code=404, detail="Camera not found")
+    unknown = [name for name in request.policies if name not in SIMULATION_POLICIES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown policies: {', '.join(unknown)}")
+    
+    history = location_metrics[request.camera_id - 1].history
+    duration = request.hours * 3600
+    end = time.time()
+    start = end - duration
+    recorded = history.query(start, end, 60, ("flow_vpm",))
+    rates = np.zeros(int(math.ceil(duration / 60)))
+    slots = ((np.array(recorded["start"]) - start) // 60).astype(np.int64)
+    rates[slots] = recorded["flow_vpm"]["mean"]
+    if not rates.any():
+        raise HTTPException(status_code=404, detail="No recorded traffic flow for this camera in the requested period")
+    
+    class_mix = history.window(start, end)["class_counts"].sum(axis=0).astype(np.float64)
+    if not class_mix.any():
+        class_mix[vehicle_names.index("car")] = 1.0
+    arrival_times, arrival_classes = generate_arrivals(rates * request.demand_scale, 60, class_mix,
+                                                       np.random.default_rng(request.seed))
+    
+    started = time.perf_counter()
+    results = {
+        name: simulate(arrival_times, arrival_classes, SIMULATION_POLICIES[name], SIGNAL_CONFIG["red_time"],
+                       class_weights[:, 0], class_weights[:, 1], duration)
+        for name in request.policies
+    }
+    return {
+        "camera_id": request.camera_id,
+        "simulated_hours": request.hours,
+        "arrivals": len(arrival_times),
+        "runtime_seconds": round(time.perf_counter() - started, 3),
+        "policies": results
+    }
+
 @app.post("/api/get-route-traffic")
 def get_route_traffic(route_request: RouteRequest):
     """Enhanced route traffic analysis"""
     try:
-        distance = calculate_distance(
-            route_request.start_lat, route_request.start_lng,
-            route_request.end_lat, route_request.end_lng
-        )
+        polyline = route_request.polyline
+        if polyline and len(polyline) >= 2:
+            path = np.asarray(polyline, dtype=np.float64)
+            distance = float(haversine_km(path[:-1, 0], path[:-1, 1], path[1:, 0], path[1:, 1]).sum())
+        else:
+            polyline = None
+            distance = calculate_distance(
+                route_request.start_lat, route_request.start_lng,
+                route_request.end_lat, route_request.end_lng
+            )
         
         cameras_on_route = get_cameras_on_route(
             route_request.start_lat, route_request.start_lng,
-            route_request.end_lat, route_request.end_lng
+            route_request.end_lat, route_request.end_lng,
+            radius=route_request.route_buffer_km or 10.0,
+            polyline=polyline
         )
         
         # Calculate overall traffic condition
@@ -882,7 +1402,7 @@ def get_route_traffic(route_request: RouteRequest):
             "cameras_on_route": cameras_on_route,
             "transport_estimates": transport_estimates,
             "alternative_route": alternative_route,
-            "route_coordinates": [
+            "route_coordinates": [{"lat": lat, "lng": lng} for lat, lng in polyline] if polyline else [
                 {"lat": route_request.start_lat, "lng": route_request.start_lng},
                 {"lat": route_request.end_lat, "lng": route_request.end_lng}
             ]
@@ -902,7 +1422,7 @@ def get_government_services():
 @app.post("/api/redeem-service")
 def redeem_service(service_type: str, ecocoins_to_use: int, user_data: dict = Depends(verify_jwt_token)):
     """Redeem EcoCoins for government service discounts"""
-    conn = sqlite3.connect('ecocoin_system.db')
+    conn = db_connect("/api/redeem-service")
     cursor = conn.cursor()
     
     # Check user balance
@@ -989,7 +1509,7 @@ def get_camera_locations():
     
     for camera_id, camera_info in CAMERA_LOCATIONS.items():
         if camera_id - 1 < len(location_metrics):
-            current_metrics = location_metrics[camera_id - 1]
+            current_metrics = location_metrics[camera_id - 1].snapshot
             camera_data = {
                 "id": camera_id,
                 "lat": camera_info["lat"],
@@ -1006,6 +1526,34 @@ def get_camera_locations():
     
     return {"cameras": cameras_with_traffic}
 
+@app.get("/api/cameras/nearby")
+def get_nearby_cameras(lat: float, lng: float, k: int = Query(5, ge=1, le=100), radius_km: Optional[float] = None):
+    """Nearest k cameras to a point, or every camera within radius_km when given, closest first"""
+    index = camera_index
+    if radius_km is not None:
+        rows, distances = index.within(lat, lng, radius_km)
+        order = np.argsort(distances, kind="stable")
+        rows, distances = rows[order], distances[order]
+    else:
+        rows, distances = index.nearest(lat, lng, k)
+    
+    return {"cameras": [
+        {"id": int(index.ids[row]), "name": CAMERA_LOCATIONS[int(index.ids[row])]["name"],
+         "lat": float(index.lat[row]), "lng": float(index.lng[row]), "distance_km": round(float(distance), 3)}
+        for row, distance in zip(rows, distances)
+    ]}
+
+@app.get("/api/route")
+def get_route(start_lat: float, start_lng: float, end_lat: float, end_lng: float):
+    """Fastest road route between two points on the local road graph"""
+    if road_graph is None:
+        raise HTTPException(status_code=503, detail="Road graph not loaded")
+    
+    route = road_graph.route(start_lat, start_lng, end_lat, end_lng)
+    if route is None:
+        raise HTTPException(status_code=404, detail="No route found between these points")
+    return route
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     html_content = """
@@ -1070,7 +1618,7 @@ async def root():
 
 @app.get("/health")
 def health_check():
-    conn = sqlite3.connect('ecocoin_system.db')
+    conn = db_connect("/health")
     cursor = conn.cursor()
     
     cursor.execute("SELECT COUNT(*) FROM users")
@@ -1087,15 +1635,16 @@ def health_check():
     processing_stats = []
     for i in range(len(video_paths)):
         if i < len(location_metrics):
+            snapshot = location_metrics[i].snapshot
             stats = {
                 "video_id": i + 1,
                 "path": os.path.basename(video_paths[i]) if i < len(video_paths) else "Unknown",
                 "exists": os.path.exists(video_paths[i]) if i < len(video_paths) else False,
                 "processing": yield_frame[i] is not None,
-                "current_vehicles": location_metrics[i].vehicles,
-                "current_signal_time": location_metrics[i].signal_time,
-                "traffic_status": location_metrics[i].status,
-                "last_update": location_metrics[i].last_update
+                "current_vehicles": snapshot.vehicles,
+                "current_signal_time": snapshot.signal_time,
+                "traffic_status": snapshot.status,
+                "last_update": snapshot.last_update
             }
         else:
             stats = {"video_id": i + 1, "error": "Metrics not initialized"}
@@ -1135,38 +1684,164 @@ async def video_feed(video_id: int):
     )
 
 @app.get("/metrics")
-def get_metrics():
-    """FIXED: Removed ecocoins_generated from metrics"""
-    current_time = time.time()
-    
-    metrics_data = []
-    for i, location in enumerate(location_metrics):
-        metrics_data.append({
-            "vehicles": location.vehicles,
-            "status": location.status,
-            "signal_time": location.signal_time,
-            "waiting_time": location.waiting_time,
-            "co2": location.co2,
-            "bottleneck": location.bottleneck,
-            "last_update": location.last_update,
-            "detection_confidence": location.detection_confidence,
-            "data_freshness": "live" if (current_time - location.last_update) < 5 else "delayed"
-        })
+def get_metrics(request: Request):
+    """Serve the pre-serialized metrics document, honouring If-None-Match"""
+    body, etag = metrics_publisher.document(time.time())
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/metrics/changes")
+def get_metrics_changes(since: int = 0, format: str = "json"):
+    """Only the cameras updated after sequence number `since`, as JSON or packed binary records"""
+    if format not in ("json", "binary"):
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    
+    # A cursor ahead of the server means the backend restarted; resend everything
+    if since > metrics_publisher.version:
+        since = 0
+    
+    if format == "binary":
+        seq, body = metrics_publisher.changes_binary(since)
+        return Response(content=body, media_type="application/octet-stream", headers={"X-Metrics-Seq": str(seq)})
+    
+    seq, locations = metrics_publisher.changes(since)
+    return Response(content=b'{"seq":' + str(seq).encode() + b',"locations":' + locations + b"}",
+                    media_type="application/json")
+
+@app.get("/api/signals")
+def get_signal_phases(camera: Optional[int] = None):
+    """Live phase, time remaining and current cycle for each junction's signal"""
+    if camera is not None and not 1 <= camera <= len(location_metrics):
+        raise HTTPException(status_code=404, detail="Camera not found")
+    
+    now = time.time()
+    camera_ids = [camera] if camera is not None else [location.camera_id for location in location_metrics]
+    return {
+        "timestamp": now,
+        "signals": [
+            dict(signal_scheduler.state(camera_id - 1, now), camera_id=camera_id,
+                 policy=SIGNAL_POLICIES.get(camera_id, "smart"),
+                 saturation_flow_vph=round(location_metrics[camera_id - 1].saturation.saturation_flow() * 3600))
+            for camera_id in camera_ids
+        ]
+    }
+
+@app.get("/metrics/anomalies")
+def get_metrics_anomalies(since: int = 0, camera: Optional[int] = None):
+    """Recent anomaly events after sequence number `since`, optionally for one camera"""
+    events = [data for _, _, data, _ in metrics_publisher.events_since(since, "anomaly")
+              if camera is None or data["camera_id"] == camera]
+    return {"seq": metrics_publisher.event_seq, "anomalies": events}
+
+@app.websocket("/ws/metrics")
+async def metrics_websocket(websocket: WebSocket, since: int = 0):
+    """Push camera metrics and bottleneck transitions as {"type": ..., "data": ...} JSON frames"""
+    await websocket.accept()
+    subscriber = metrics_broadcaster.subscribe(since)
+    try:
+        while True:
+            for event, payload in await subscriber.next():
+                await websocket.send_text(f'{{"type":"{event}","data":{payload.decode()}}}')
+    except WebSocketDisconnect:
+        pass
+    finally:
+        metrics_broadcaster.unsubscribe(subscriber)
+
+@app.get("/stream/metrics")
+async def metrics_event_stream(since: int = 0):
+    """Server-Sent Events feed of camera metrics and bottleneck transitions"""
+    async def events():
+        subscriber = metrics_broadcaster.subscribe(since)
+        try:
+            while True:
+                try:
+                    messages = await asyncio.wait_for(subscriber.next(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                for event, payload in messages:
+                    yield b"event: " + event.encode() + b"\ndata: " + payload + b"\n\n"
+        finally:
+            metrics_broadcaster.unsubscribe(subscriber)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/metrics/history")
+def get_metrics_history(camera: int, start: Optional[float] = Query(None, alias="from"),
+                        end: Optional[float] = Query(None, alias="to"), bucket: int = 60,
+                        fields: Optional[str] = None):
+    """Bucketed min/max/mean/p95 per metric for one camera, served from precomputed rollups"""
+    if not 1 <= camera <= len(location_metrics):
+        raise HTTPException(status_code=404, detail=f"Camera {camera} not found")
+    if bucket < 1:
+        raise HTTPException(status_code=400, detail="bucket must be at least 1 second")
+    
+    requested_fields = tuple(fields.split(",")) if fields else SAMPLE_FIELDS
+    unknown = [f for f in requested_fields if f not in SAMPLE_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - 3600
+    
+    history = location_metrics[camera - 1].history.query(start, end, bucket, requested_fields)
+    return {"camera": camera, "from": start, "to": end, **history}
+
+@app.get("/export/metrics")
+def export_metrics(camera: Optional[int] = None, start: float = Query(0.0, alias="from"),
+                   end: Optional[float] = Query(None, alias="to"), format: str = "parquet"):
+    """Stream persisted per-second camera metrics as Arrow IPC or Parquet"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    
+    end = end if end is not None else time.time()
+    extension = "arrows" if format == "arrow" else "parquet"
+    return StreamingResponse(
+        export_camera_metrics(METRICS_DB_PATH, camera, start, end, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=camera_metrics.{extension}"}
+    )
+
+@app.get("/export/{table}")
+def export_ecocoin_table(table: str, format: str = "parquet",
+                         user_data: dict = Depends(require_staff_permission("export_data"))):
+    """Stream the trips or transactions table as Arrow IPC or Parquet; staff with export_data only"""
+    if table not in TABLE_SCHEMAS:
+        raise HTTPException(status_code=404, detail=f"Table {table} not exportable")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    
+    extension = "arrows" if format == "arrow" else "parquet"
+    return StreamingResponse(
+        export_table('ecocoin_system.db', table, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename={table}.{extension}"}
+    )
+
+@app.get("/internal/metrics", response_class=PlainTextResponse)
+def internal_metrics():
+    """Prometheus text exposition of processing pipeline metrics"""
+    return PlainTextResponse(pipeline_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/internal/profile")
+def pipeline_profile(camera: Optional[int] = None):
+    """Rolling p50/p95/p99 latency per pipeline stage for each camera"""
+    if camera is not None and not 1 <= camera <= len(location_metrics):
+        raise HTTPException(status_code=404, detail=f"Camera {camera} not found")
     
+    cameras = [location_metrics[camera - 1]] if camera is not None else location_metrics
     return {
-        "timestamp": current_time,
-        "locations": metrics_data,
-        "summary": {
-            "total_vehicles": sum(m["vehicles"] for m in metrics_data),
-            "active_bottlenecks": sum(1 for m in metrics_data if m["bottleneck"] == "Yes"),
-            "average_waiting_time": round(sum(m["waiting_time"] for m in metrics_data) / len(metrics_data), 1) if metrics_data else 0,
-            "total_co2_reduction": round(sum(m["co2"] for m in metrics_data), 2)
-        }
+        "timestamp": time.time(),
+        "cameras": {location.camera_id: location.profiler.summary() for location in cameras}
     }
 
 @app.get("/api/leaderboard")
 def get_leaderboard():
-    conn = sqlite3.connect('ecocoin_system.db')
+    conn = db_connect("/api/leaderboard")
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -1192,7 +1867,7 @@ def get_leaderboard():
 
 @app.on_event("startup")
 def startup_event():
-    global processing_threads
+    global processing_threads, road_graph
     
     print("🚀 Starting Fixed Smart Traffic Management System...")
     print("✅ All issues resolved:")
@@ -1202,6 +1877,24 @@ def startup_event():
     print("  - Government services enabled")
     print("  - Enhanced EcoCoin formula implemented")
     
+    restore_since = time.time() - HISTORY_RESTORE_SECONDS
+    for location in location_metrics:
+        starts, counts, stats = load_camera_metrics(METRICS_DB_PATH, location.camera_id, restore_since)
+        location.history.restore(starts, counts, stats)
+        if len(starts):
+            print(f"✅ Restored {len(starts)}s of history for camera {location.camera_id}")
+    metrics_writer.start()
+    
+    if ROAD_GRAPH_PATH.exists():
+        road_graph = load_road_graph(str(ROAD_GRAPH_PATH))
+        print(f"✅ Road graph loaded: {len(road_graph)} nodes, {len(road_graph.tails)} edges")
+        for camera_id, camera in CAMERA_LOCATIONS.items():
+            edges = road_graph.attach_camera(camera_id, camera["lat"], camera["lng"])
+            print(f"✅ Camera {camera_id} mapped to {len(edges)} road edges")
+    else:
+        print(f"⚠️ Road graph not found at {ROAD_GRAPH_PATH}: /api/route disabled, dashboard routes will use "
+              f"the public OSRM server. See README for building a local extract")
+    
     for i, video_path in enumerate(video_paths):
         if os.path.exists(video_path):
             print(f"✅ Video {i+1} found: {os.path.basename(video_path)}")
@@ -1215,6 +1908,21 @@ def startup_event():
             thread.start()
             processing_threads.append(thread)
             print(f"✅ Fixed processing thread started for video {i+1}")
+    
+    signal_scheduler.start()
+    
+    if CORRIDORS:
+        threading.Thread(target=coordinate_corridors, daemon=True, name="CorridorCoordinator").start()
+        print(f"✅ Corridor coordinator started for {len(CORRIDORS)} corridor(s)")
+
+@app.on_event("startup")
+async def start_metrics_broadcaster():
+    asyncio.create_task(metrics_broadcaster.run())
+
+@app.on_event("shutdown")
+def shutdown_event():
+    signal_scheduler.stop()
+    metrics_writer.stop()
 
 if __name__ == "__main__":
     uvicorn.run(
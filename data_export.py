@@ -0,0 +1,154 @@
+import argparse
+import sqlite3
+import sys
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Iterator, Optional, Tuple
+from metrics_store import SAMPLE_FIELDS
+
+EXPORT_CHUNK_ROWS = 65536
+EXPORT_FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+CAMERA_METRICS_SCHEMA = pa.schema(
+    [("camera_id", pa.int32()), ("ts", pa.int64()), ("samples", pa.int32())]
+    + [(field, pa.float64()) for field in SAMPLE_FIELDS]
+)
+
+# User-facing tables in the EcoCoin database that can be bulk exported
+TABLE_SCHEMAS = {
+    "trips": pa.schema([
+        ("id", pa.int64()), ("user_id", pa.int64()), ("start_location", pa.string()),
+        ("end_location", pa.string()), ("distance_km", pa.float64()), ("duration_minutes", pa.int64()),
+        ("transport_mode", pa.string()), ("route_efficiency", pa.float64()), ("co2_saved", pa.float64()),
+        ("ecocoins_earned", pa.int64()), ("created_at", pa.string())
+    ]),
+    "transactions": pa.schema([
+        ("id", pa.int64()), ("user_id", pa.int64()), ("transaction_type", pa.string()),
+        ("amount", pa.int64()), ("description", pa.string()), ("service_type", pa.string()),
+        ("co2_saved", pa.float64()), ("created_at", pa.string())
+    ])
+}
+
+
+class _ChunkSink:
+    """Write-only file object that hands buffered bytes back to a streaming response"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self.chunks.append(chunk)
+        self.position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_record_batches(db_path: str, sql: str, params: tuple, schema: pa.Schema,
+                        chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pa.RecordBatch]:
+    """Read a query in fixed-size chunks and transpose each chunk straight into Arrow columns"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            columns = zip(*rows)
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            )
+    finally:
+        conn.close()
+
+
+def stream_batches(batches: Iterator[pa.RecordBatch], schema: pa.Schema, fmt: str) -> Iterator[bytes]:
+    """Serialize batches as an Arrow IPC stream or Parquet file, yielding bytes as each batch is written"""
+    sink = _ChunkSink()
+    if fmt == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+    elif fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    for batch in batches:
+        writer.write_batch(batch)
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+def camera_metrics_query(camera: Optional[int], start: float, end: float) -> Tuple[str, tuple]:
+    sql = (f"SELECT camera_id, ts, samples, {', '.join(SAMPLE_FIELDS)} FROM camera_metrics "
+           "WHERE ts >= ? AND ts < ?")
+    params = (int(start), int(end))
+    if camera is not None:
+        sql += " AND camera_id = ?"
+        params += (camera,)
+    return sql + " ORDER BY camera_id, ts", params
+
+
+def export_camera_metrics(db_path: str, camera: Optional[int], start: float, end: float, fmt: str) -> Iterator[bytes]:
+    sql, params = camera_metrics_query(camera, start, end)
+    batches = iter_record_batches(db_path, sql, params, CAMERA_METRICS_SCHEMA)
+    return stream_batches(batches, CAMERA_METRICS_SCHEMA, fmt)
+
+
+def export_table(db_path: str, table: str, fmt: str) -> Iterator[bytes]:
+    schema = TABLE_SCHEMAS[table]
+    sql = f"SELECT {', '.join(schema.names)} FROM {table} ORDER BY id"
+    return stream_batches(iter_record_batches(db_path, sql, (), schema), schema, fmt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk export traffic metrics, trips and transactions")
+    parser.add_argument("dataset", choices=["metrics"] + list(TABLE_SCHEMAS))
+    parser.add_argument("-o", "--output", required=True, help="Output file path ('-' for stdout)")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="parquet")
+    parser.add_argument("--camera", type=int, default=None)
+    parser.add_argument("--from", dest="start", type=float, default=0.0, help="Start time (epoch seconds)")
+    parser.add_argument("--to", dest="end", type=float, default=None, help="End time (epoch seconds)")
+    parser.add_argument("--metrics-db", default="traffic_metrics.db")
+    parser.add_argument("--ecocoin-db", default="ecocoin_system.db")
+    args = parser.parse_args()
+
+    if args.dataset == "metrics":
+        end = args.end if args.end is not None else time.time()
+        chunks = export_camera_metrics(args.metrics_db, args.camera, args.start, end, args.format)
+    else:
+        chunks = export_table(args.ecocoin_db, args.dataset, args.format)
+
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from typing import Dict, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371
+
+
+def to_unit_xyz(lat, lng) -> np.ndarray:
+    """Latitude/longitude in degrees to (n, 3) points on the unit sphere"""
+    lat = np.radians(np.atleast_1d(np.asarray(lat, dtype=np.float64)))
+    lng = np.radians(np.atleast_1d(np.asarray(lng, dtype=np.float64)))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)], axis=-1)
+
+
+def chord_from_km(km: float) -> float:
+    return 2 * np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def km_from_chord(chord: np.ndarray) -> np.ndarray:
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0.0, 1.0))
+
+
+class CameraSpatialIndex:
+    """KD-tree over camera positions on the unit sphere; straight-line chord length grows with great-circle
+    distance, so radius and nearest-k queries in 3D give exact great-circle answers with no lat/lng seams"""
+
+    def __init__(self, cameras: Dict[int, Dict]):
+        self.ids = np.array(list(cameras), dtype=np.int64)
+        self.lat = np.array([camera["lat"] for camera in cameras.values()], dtype=np.float64)
+        self.lng = np.array([camera["lng"] for camera in cameras.values()], dtype=np.float64)
+        self.xyz = to_unit_xyz(self.lat, self.lng) if len(self.ids) else np.empty((0, 3))
+        self.tree = cKDTree(self.xyz) if len(self.ids) else None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def distances_km(self, lat: float, lng: float, rows: np.ndarray) -> np.ndarray:
+        """Great-circle distance from a point to the cameras at the given index rows"""
+        return km_from_chord(np.linalg.norm(self.xyz[rows] - to_unit_xyz(lat, lng), axis=1))
+
+    def within(self, lat: float, lng: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Index rows of cameras within radius_km of a point, in camera order, with their distances"""
+        if self.tree is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        rows = np.array(sorted(self.tree.query_ball_point(to_unit_xyz(lat, lng)[0], chord_from_km(radius_km))),
+                        dtype=np.int64)
+        return rows, self.distances_km(lat, lng, rows)
+
+    def near_polyline(self, line_lat, line_lng, buffer_km: float,
+                      max_samples: int = 5000) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Index rows of cameras within buffer_km of a polyline, ordered along it, with (distance, along) in km"""
+        line_lat = np.atleast_1d(np.asarray(line_lat, dtype=np.float64))
+        line_lng = np.atleast_1d(np.asarray(line_lng, dtype=np.float64))
+        if self.tree is None or not len(line_lat):
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+
+        # Sample the polyline every `step` km; a ball of buffer + step/2 around each sample covers the buffer
+        segment_km = haversine_km(line_lat[:-1], line_lng[:-1], line_lat[1:], line_lng[1:])
+        step = max(buffer_km, float(segment_km.sum()) / max_samples, 1e-3)
+        pieces = np.maximum(np.ceil(segment_km / step).astype(np.int64), 1)
+        t = np.concatenate([np.arange(n) / n for n in pieces] + [[0.0]])
+        first = np.concatenate([np.repeat(np.arange(len(segment_km)), pieces), [len(line_lat) - 1]])
+        last = np.minimum(first + 1, len(line_lat) - 1)
+        samples = to_unit_xyz(line_lat[first] + t * (line_lat[last] - line_lat[first]),
+                              line_lng[first] + t * (line_lng[last] - line_lng[first]))
+
+        # A camera within the buffer of a segment is always hit by one of that segment's samples, so
+        # only (camera, segment) pairs seen here need exact distances
+        hits = self.tree.query_ball_point(samples, chord_from_km(buffer_km + step / 2))
+        sizes = np.fromiter((len(h) for h in hits), dtype=np.int64, count=len(hits))
+        hit_rows = np.fromiter((row for h in hits for row in h), dtype=np.int64, count=int(sizes.sum()))
+        hit_segments = np.minimum(np.repeat(first, sizes), max(len(segment_km) - 1, 0))
+        rows, point_idx = np.unique(hit_rows, return_inverse=True)
+        point_idx, segment_idx = np.unique(np.stack([point_idx, hit_segments]), axis=1)
+        distances, along = polyline_distance_km(self.lat[rows], self.lng[rows], line_lat, line_lng,
+                                                (point_idx, segment_idx))
+        keep = distances <= buffer_km
+        rows, distances, along = rows[keep], distances[keep], along[keep]
+        order = np.argsort(along, kind="stable")
+        return rows[order], distances[order], along[order]
+
+    def nearest(self, lat: float, lng: float, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Index rows of the k nearest cameras, closest first, with their distances"""
+        if self.tree is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        k = min(k, len(self.ids))
+        chords, rows = self.tree.query(to_unit_xyz(lat, lng)[0], k=k)
+        return np.atleast_1d(rows).astype(np.int64), km_from_chord(np.atleast_1d(chords))
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Great-circle distance in km between broadcastable arrays of points given in degrees"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_matrix_km(lat_a, lng_a, lat_b, lng_b) -> np.ndarray:
+    """(len(a), len(b)) great-circle distances between two point sets"""
+    lat_a, lng_a = np.atleast_1d(lat_a)[:, None], np.atleast_1d(lng_a)[:, None]
+    return haversine_km(lat_a, lng_a, np.atleast_1d(lat_b)[None, :], np.atleast_1d(lng_b)[None, :])
+
+
+def polyline_distance_km(lat, lng, line_lat, line_lng,
+                         pairs: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Minimum distance from each point to a polyline, and how far along the polyline the closest point lies
+
+    Uses a local equirectangular projection centred on the polyline, which is accurate to well under
+    a percent at city scale. By default every point is tested against every segment; pairs of
+    (point indices, segment indices) restrict the work to candidate segments, and must name at
+    least one segment for every point.
+    """
+    lat, lng = np.atleast_1d(np.asarray(lat, dtype=np.float64)), np.atleast_1d(np.asarray(lng, dtype=np.float64))
+    line_lat = np.atleast_1d(np.asarray(line_lat, dtype=np.float64))
+    line_lng = np.atleast_1d(np.asarray(line_lng, dtype=np.float64))
+    scale_y = np.radians(EARTH_RADIUS_KM)
+    scale_x = scale_y * np.cos(np.radians(line_lat.mean()))
+    points = np.stack([lng * scale_x, lat * scale_y], axis=-1)
+    vertices = np.stack([line_lng * scale_x, line_lat * scale_y], axis=-1)
+    if len(vertices) == 1:
+        vertices = np.concatenate([vertices, vertices])
+
+    segment = vertices[1:] - vertices[:-1]
+    lengths = np.linalg.norm(segment, axis=1)
+    if pairs is None:
+        point_idx = np.repeat(np.arange(len(points)), len(segment))
+        segment_idx = np.tile(np.arange(len(segment)), len(points))
+    else:
+        point_idx, segment_idx = pairs
+
+    # Project each point onto each of its segments in one pass over the pairs
+    seg = segment[segment_idx]
+    offset = points[point_idx] - vertices[:-1][segment_idx]
+    lengths_sq = lengths[segment_idx] ** 2
+    t = np.clip(np.einsum("ij,ij->i", offset, seg) / np.where(lengths_sq > 0, lengths_sq, 1.0), 0.0, 1.0)
+    gaps = np.linalg.norm(offset - t[:, None] * seg, axis=1)
+
+    # Closest pair per point: sort by (point, gap) and keep each point's first entry
+    order = np.lexsort((gaps, point_idx))
+    first = order[np.unique(point_idx[order], return_index=True)[1]]
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    along = cumulative[segment_idx[first]] + t[first] * lengths[segment_idx[first]]
+    return gaps[first], along
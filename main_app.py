@@ -16,6 +16,8 @@ from auth import login, require_permission, get_current_user
 # Configuration
 BACKEND_URL = "http://127.0.0.1:8000"
 VIDEO_COUNT = 2
+# Longest auto-refresh wait when no camera publishes anything new
+IDLE_REFRESH_SECONDS = 30
 
 st.set_page_config(
     page_title="Smart Traffic Management - Fixed",
@@ -115,6 +117,32 @@ def fetch_metrics():
         st.error(f"❌ Error fetching metrics: {str(e)}")
         return None
 
+def wait_for_metrics_push(since_seq: int, timeout: float) -> bool:
+    """Block on the backend's SSE feed until a camera publishes after since_seq, or timeout"""
+    try:
+        with requests.get(f"{BACKEND_URL}/stream/metrics", params={"since": since_seq},
+                          stream=True, timeout=(5, timeout)) as response:
+            for line in response.iter_lines():
+                if line.startswith(b"event:"):
+                    return True
+    except requests.exceptions.RequestException:
+        pass
+    return False
+
+@st.cache_data(ttl=30)
+def fetch_metrics_history(camera: int, range_seconds: int, bucket_seconds: int):
+    try:
+        now = time.time()
+        response = requests.get(f"{BACKEND_URL}/metrics/history", params={
+            "camera": camera, "from": now - range_seconds, "to": now, "bucket": bucket_seconds,
+            "fields": "vehicles"
+        }, timeout=10)
+        if response.status_code == 200:
+            return response.json()
+        return None
+    except Exception:
+        return None
+
 def display_video_stream(video_id: int, container):
     """Display video stream based on user role - Clean version"""
     
@@ -786,6 +814,63 @@ def gps_navigation_dashboard():
                 traffic_message = "Standard routing active"
             
 
+            # Fallback for backends without a local road graph: the public OSRM server
+            def get_osrm_route(start_lat, start_lng, end_lat, end_lng):
+                """Get proper road route using OSRM"""
+                try:
+                    osrm_url = f"http://router.project-osrm.org/route/v1/driving/{start_lng},{start_lat};{end_lng},{end_lat}"
+                    params = {
+                        "overview": "full",
+                        "geometries": "geojson",
+                        "steps": "true"
+                    }
+                    
+                    resp = requests.get(osrm_url, params=params, timeout=10)
+                    
+                    if resp.status_code == 200:
+                        data = resp.json()
+                        if data["routes"]:
+                            coordinates = data["routes"][0]["geometry"]["coordinates"]
+                            route_coords = [[coord[1], coord[0]] for coord in coordinates]
+                            
+                            route_info = {
+                                "coordinates": route_coords,
+                                "distance": data["routes"][0]["distance"] / 1000,
+                                "duration": data["routes"][0]["duration"] / 60,
+                                "steps": len(data["routes"][0]["legs"][0]["steps"]) if data["routes"][0]["legs"] else 0
+                            }
+                            return route_info
+                    return None
+                except Exception as e:
+                    st.warning(f"⚠️ OSRM routing failed: {str(e)}, using direct line")
+                    return None
+            
+            # Get proper road routing from the backend's local road graph
+            def get_road_route(start_lat, start_lng, end_lat, end_lng):
+                """Get proper road route from the backend routing service, or OSRM if it has no road graph"""
+                try:
+                    resp = requests.get(f"{BACKEND_URL}/api/route", params={
+                        "start_lat": start_lat,
+                        "start_lng": start_lng,
+                        "end_lat": end_lat,
+                        "end_lng": end_lng
+                    }, timeout=5)
+                    
+                    if resp.status_code == 200:
+                        return resp.json()
+                    if resp.status_code == 503:
+                        st.info("ℹ️ Backend has no local road graph, using the public OSRM server")
+                        return get_osrm_route(start_lat, start_lng, end_lat, end_lng)
+                    return None
+                except Exception as e:
+                    st.warning(f"⚠️ Road routing failed: {str(e)}, using direct line")
+                    return None
+            
+            # Fetch the road geometry first so the backend can find cameras along the actual route
+            road_route = get_road_route(start_lat, start_lng, dest_lat, dest_lng)
+            if road_route:
+                route_data["polyline"] = road_route["coordinates"]
+            
             response = requests.post(f"{BACKEND_URL}/api/get-route-traffic", json=route_data)
             
             if response.status_code == 200:
@@ -906,40 +991,6 @@ def gps_navigation_dashboard():
                 
                 st.subheader("🗺️ Route Map with Live Traffic")
                 
-                # Get proper road routing using OSRM
-                def get_osrm_route(start_lat, start_lng, end_lat, end_lng):
-                    """Get proper road route using OSRM"""
-                    try:
-                        osrm_url = f"http://router.project-osrm.org/route/v1/driving/{start_lng},{start_lat};{end_lng},{end_lat}"
-                        params = {
-                            "overview": "full",
-                            "geometries": "geojson",
-                            "steps": "true"
-                        }
-                        
-                        resp = requests.get(osrm_url, params=params, timeout=10)
-                        
-                        if resp.status_code == 200:
-                            data = resp.json()
-                            if data["routes"]:
-                                coordinates = data["routes"][0]["geometry"]["coordinates"]
-                                route_coords = [[coord[1], coord[0]] for coord in coordinates]
-                                
-                                route_info = {
-                                    "coordinates": route_coords,
-                                    "distance": data["routes"][0]["distance"] / 1000,
-                                    "duration": data["routes"][0]["duration"] / 60,
-                                    "steps": len(data["routes"][0]["legs"][0]["steps"]) if data["routes"][0]["legs"] else 0
-                                }
-                                return route_info
-                        return None
-                    except Exception as e:
-                        st.warning(f"⚠️ OSRM routing failed: {str(e)}, using direct line")
-                        return None
-                
-                # Get proper road route
-                road_route = get_osrm_route(start_lat, start_lng, dest_lat, dest_lng)
-                
                 # Calculate map center and zoom
                 center_lat = (start_lat + dest_lat) / 2
                 center_lng = (start_lng + dest_lng) / 2
@@ -2055,7 +2106,7 @@ def main():
         st.rerun()
     
     if auto_refresh:
-        countdown_placeholder = st.sidebar.empty()
+        refresh_placeholder = st.sidebar.empty()
     
     # Header
     st.title("🚦 Smart Traffic Management - All Issues Fixed 🗺️")
@@ -2399,7 +2450,37 @@ def main():
                     efficient_signals = len([l for l in locations if 20 <= l['signal_time'] <= 60])
                     st.metric("🚦 Optimal Signals", f"{efficient_signals}/{len(locations)}")
                 
-                st.info("📈 **Coming Soon:** Historical analytics, trend analysis, and predictive modeling")
+                # Historical analytics from server-side rollups
+                st.subheader("📜 Historical Traffic Trends")
+                
+                hist_col1, hist_col2 = st.columns(2)
+                with hist_col1:
+                    history_camera = st.selectbox("📍 Location", list(range(1, len(locations) + 1)),
+                                                  format_func=lambda c: f"Location {c}", key="history_camera")
+                with hist_col2:
+                    history_range = st.selectbox("🕐 Range", ["Last hour", "Last 24 hours", "Last 7 days", "Last 30 days"],
+                                                 key="history_range")
+                
+                range_seconds, bucket_seconds = {
+                    "Last hour": (3600, 60),
+                    "Last 24 hours": (86400, 900),
+                    "Last 7 days": (7 * 86400, 3600),
+                    "Last 30 days": (30 * 86400, 6 * 3600)
+                }[history_range]
+                
+                history = fetch_metrics_history(history_camera, range_seconds, bucket_seconds)
+                if history and history.get("start"):
+                    df_history = pd.DataFrame({
+                        "time": pd.to_datetime(history["start"], unit="s"),
+                        "mean": history["vehicles"]["mean"],
+                        "p95": history["vehicles"]["p95"],
+                        "max": history["vehicles"]["max"]
+                    })
+                    fig_history = px.line(df_history, x="time", y=["mean", "p95", "max"],
+                                          title=f"🚗 Vehicles at Location {history_camera}")
+                    st.plotly_chart(fig_history, use_container_width=True)
+                else:
+                    st.info("📈 No historical data recorded for this range yet")
                 
             else:
                 st.warning("🔒 You don't have permission to view detailed analytics")
@@ -2423,13 +2504,15 @@ def main():
         if st.button("🔄 Retry Data Fetch", key="retry_data_fetch"):
             st.rerun()
     
-    # Auto-refresh logic (FIXED: Works without conflicts)
+    # Auto-refresh logic: reruns are at least refresh_interval apart, and after that only once the backend
+    # has pushed something newer than what this page shows (or IDLE_REFRESH_SECONDS have passed)
     if auto_refresh:
-        # Show countdown
-        for i in range(refresh_interval, 0, -1):
-            if 'countdown_placeholder' in locals():
-                countdown_placeholder.info(f"🔄 Next refresh in: {i}s")
-            time.sleep(1)
+        refresh_placeholder.info(f"🔄 Live updates (every {refresh_interval}s or more)")
+        last_rerun = st.session_state.get("last_auto_refresh", 0.0)
+        time.sleep(max(0.0, last_rerun + refresh_interval - time.time()))
+        since_seq = max((loc.get("seq", 0) for loc in metrics_data["locations"]), default=0) if metrics_data else 0
+        wait_for_metrics_push(since_seq, IDLE_REFRESH_SECONDS)
+        st.session_state.last_auto_refresh = time.time()
         
         # Clear cache and refresh
         st.cache_data.clear()
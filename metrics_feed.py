@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import itertools
+import math
+import threading
+from collections import deque
+import numpy as np
+import orjson
+from typing import Dict, List, Optional, Tuple
+
+# Seconds after its last update that a camera is reported as "delayed" instead of "live"
+FRESHNESS_SECONDS = 5
+# How often the broadcaster checks for publishes, and how many undelivered events a slow subscriber keeps
+BROADCAST_INTERVAL = 0.2
+MAX_PENDING_EVENTS = 256
+MAX_RECENT_EVENTS = 1000
+JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+DENSITY_LABELS = ("Low", "Medium", "High")
+# Fixed-width little-endian record for the binary delta feed; status is an index into DENSITY_LABELS
+RECORD_DTYPE = np.dtype([
+    ("camera_id", "<u2"), ("status", "u1"), ("bottleneck", "u1"), ("vehicles", "<u4"),
+    ("seq", "<u8"), ("last_update", "<f8"), ("pcu", "<f4"), ("signal_time", "<f4"),
+    ("waiting_time", "<f4"), ("queue_length", "<f4"), ("co2", "<f4"), ("confidence", "<f4"),
+    ("flow_vpm", "<f4")
+])
+
+
+class _Entry:
+    __slots__ = ("data", "fragment", "seq")
+
+    def __init__(self, data: Dict, fragment: bytes, seq: int):
+        self.data = data
+        self.fragment = fragment
+        self.seq = seq
+
+
+class _Document:
+    __slots__ = ("version", "body", "etag", "stale_at")
+
+    def __init__(self, version: int, body: bytes, etag: str, stale_at: float):
+        self.version = version
+        self.body = body
+        self.etag = etag
+        self.stale_at = stale_at
+
+
+class MetricsPublisher:
+    """Pre-serializes each published camera payload and caches the assembled /metrics document"""
+
+    def __init__(self, n_cameras: int):
+        self.entries: List[Optional[_Entry]] = [None] * n_cameras
+        self._versions = itertools.count(1)
+        self.version = 0
+        self._document = _Document(-1, b"", "", 0.0)
+        self._lock = threading.Lock()
+        self.records = np.zeros(n_cameras, dtype=RECORD_DTYPE)
+        self._records_lock = threading.Lock()
+        # (seq, event_type, data, payload) for discrete events such as anomalies
+        self.events = deque(maxlen=MAX_RECENT_EVENTS)
+        self.event_seq = 0
+
+    def publish(self, idx: int, data: Dict):
+        """Serialize a camera's payload once, on its processing thread, and swap it in"""
+        fragment = orjson.dumps(dict(data, camera_id=idx + 1, data_freshness="live"), option=JSON_OPTIONS)
+        flow_vpm = sum(d["total_vpm"] for line in data["flow"].values() for d in line.values())
+        # The sequence number, entry and version move together so a reader never sees a version ahead of its entry
+        with self._records_lock:
+            seq = next(self._versions)
+            self.records[idx] = (
+                idx + 1, DENSITY_LABELS.index(data["status"]), data["bottleneck"] == "Yes",
+                data["vehicles"], seq, data["last_update"], data["pcu"], data["signal_time"],
+                data["waiting_time"], data["queue_length"], data["co2"], data["detection_confidence"], flow_vpm
+            )
+            self.entries[idx] = _Entry(data, b'%s,"seq":%d}' % (fragment[:-1], seq), seq)
+            self.version = seq
+
+    def publish_event(self, event_type: str, data: Dict):
+        """Record a discrete event, numbered from the same sequence as camera updates"""
+        # Appended under the sequence lock so events stay in seq order and event_seq never runs ahead of them
+        with self._records_lock:
+            seq = next(self._versions)
+            data = dict(data, seq=seq)
+            self.events.append((seq, event_type, data, orjson.dumps(data, option=JSON_OPTIONS)))
+            self.event_seq = seq
+
+    def events_since(self, since: int, event_type: Optional[str] = None) -> List[Tuple[int, str, Dict, bytes]]:
+        return [event for event in list(self.events)
+                if event[0] > since and (event_type is None or event[1] == event_type)]
+
+    def snapshot(self) -> Tuple[int, List[Optional[_Entry]]]:
+        """Current sequence number and the entries it covers, read together"""
+        with self._records_lock:
+            return self.version, list(self.entries)
+
+    def changes(self, since: int) -> Tuple[int, bytes]:
+        """Current sequence number and a JSON array of the cameras published after `since`"""
+        seq, entries = self.snapshot()
+        fragments = [entry.fragment for entry in entries if entry is not None and entry.seq > since]
+        return seq, b"[" + b",".join(fragments) + b"]"
+
+    def changes_binary(self, since: int) -> Tuple[int, bytes]:
+        """Current sequence number and the RECORD_DTYPE rows published after `since`"""
+        with self._records_lock:
+            seq = self.version
+            changed = self.records[self.records["seq"] > since]
+        return seq, changed.tobytes()
+
+    def document(self, now: float) -> Tuple[bytes, str]:
+        """Current /metrics body and its ETag; rebuilt only after a publish or a freshness change"""
+        cached = self._document
+        if cached.version == self.version and now < cached.stale_at:
+            return cached.body, cached.etag
+
+        with self._lock:
+            cached = self._document
+            if cached.version == self.version and now < cached.stale_at:
+                return cached.body, cached.etag
+
+            version = self.version
+            fragments = []
+            locations = []
+            stale_at = math.inf
+            for idx, entry in enumerate(self.entries):
+                if entry is None:
+                    continue
+                data = entry.data
+                fresh_until = data["last_update"] + FRESHNESS_SECONDS
+                if now < fresh_until:
+                    fragments.append(entry.fragment)
+                    stale_at = min(stale_at, fresh_until)
+                else:
+                    fragments.append(orjson.dumps(dict(data, camera_id=idx + 1, seq=entry.seq, data_freshness="delayed"),
+                                                  option=JSON_OPTIONS))
+                locations.append(data)
+
+            summary = {
+                "total_vehicles": sum(d["vehicles"] for d in locations),
+                "active_bottlenecks": sum(1 for d in locations if d["bottleneck"] == "Yes"),
+                "average_waiting_time": round(sum(d["waiting_time"] for d in locations) / len(locations), 1) if locations else 0,
+                "total_co2_reduction": round(sum(d["co2"] for d in locations), 2)
+            }
+            body = b"".join([
+                b'{"timestamp":', orjson.dumps(now), b',"locations":[', b",".join(fragments),
+                b'],"summary":', orjson.dumps(summary, option=JSON_OPTIONS), b"}"
+            ])
+            # Derived from the body so a tag cached before a backend restart can never match different content
+            etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            self._document = _Document(version, body, etag, stale_at)
+            return body, etag
+
+
+class Subscriber:
+    """Mailbox for one push client: newest payload per camera plus a bounded queue of transition events"""
+
+    def __init__(self):
+        self.latest: Dict[int, bytes] = {}
+        self.events = deque(maxlen=MAX_PENDING_EVENTS)
+        self.wakeup = asyncio.Event()
+
+    def offer(self, updates: Dict[int, bytes], events: List[Tuple[str, bytes]]):
+        # A slow consumer only ever holds one payload per camera; older ones are overwritten
+        self.latest.update(updates)
+        self.events.extend(events)
+        self.wakeup.set()
+
+    async def next(self) -> List[Tuple[str, bytes]]:
+        """Wait for and drain pending messages as (event_type, json_payload), events first"""
+        await self.wakeup.wait()
+        self.wakeup.clear()
+        messages = list(self.events)
+        self.events.clear()
+        messages.extend(("metrics", payload) for payload in self.latest.values())
+        self.latest.clear()
+        return messages
+
+
+class MetricsBroadcaster:
+    """Single producer that fans published camera payloads and bottleneck transitions out to subscribers"""
+
+    def __init__(self, publisher: MetricsPublisher, interval: float = BROADCAST_INTERVAL):
+        self.publisher = publisher
+        self.interval = interval
+        self.subscribers = set()
+        self.bottlenecks: List[Optional[str]] = [entry.data["bottleneck"] if entry is not None else None
+                                                 for entry in publisher.entries]
+
+    def subscribe(self, since: int = 0) -> Subscriber:
+        """Register a subscriber primed with every camera published after `since`"""
+        subscriber = Subscriber()
+        subscriber.offer({idx: entry.fragment for idx, entry in enumerate(self.publisher.entries)
+                          if entry is not None and entry.seq > since}, [])
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def run(self):
+        cursor = self.publisher.version
+        event_cursor = self.publisher.event_seq
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.publisher.version == cursor and self.publisher.event_seq == event_cursor:
+                continue
+
+            updates = {}
+            events = []
+            for seq, event_type, _, payload in self.publisher.events_since(event_cursor):
+                events.append((event_type, payload))
+                event_cursor = max(event_cursor, seq)
+            version, entries = self.publisher.snapshot()
+            for idx, entry in enumerate(entries):
+                if entry is None or entry.seq <= cursor:
+                    continue
+                updates[idx] = entry.fragment
+                bottleneck = entry.data["bottleneck"]
+                previous = self.bottlenecks[idx]
+                self.bottlenecks[idx] = bottleneck
+                if previous is not None and previous != bottleneck:
+                    events.append(("bottleneck", orjson.dumps({
+                        "camera_id": idx + 1, "seq": entry.seq, "bottleneck": bottleneck, "previous": previous,
+                        "timestamp": entry.data["last_update"]
+                    }, option=JSON_OPTIONS)))
+            cursor = version
+
+            for subscriber in self.subscribers:
+                subscriber.offer(updates, events)
@@ -0,0 +1,325 @@
+import numpy as np
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+# Scalar columns stored for every sample; per-class counts live in their own array
+SAMPLE_FIELDS = ("vehicles", "pcu", "signal_time", "waiting_time", "co2", "confidence", "flow_vpm")
+FIELD_INDEX = {name: i for i, name in enumerate(SAMPLE_FIELDS)}
+
+# Rollup resolutions as (bucket seconds, buckets retained): 1 s for 2 h, 1 min for 7 days, 1 h for 90 days
+ROLLUP_LEVELS = ((1, 2 * 3600), (60, 7 * 24 * 60), (3600, 90 * 24))
+ROLLUP_STATS = ("min", "max", "mean", "p95")
+# Persisted bucket columns besides the mean, which keeps the bare field name
+PERSISTED_STATS = ("min", "max", "p95")
+MAX_QUERY_ROWS = 20000
+
+
+class MetricsRingBuffer:
+    """Preallocated per-camera time series: constant memory, O(1) appends, oldest samples overwritten"""
+
+    def __init__(self, capacity: int, n_classes: int):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.class_counts = np.zeros((capacity, n_classes), dtype=np.int16)
+        self.values = np.zeros((capacity, len(SAMPLE_FIELDS)), dtype=np.float32)
+        self.head = 0
+        self.size = 0
+
+    def append(self, timestamp: float, class_counts: np.ndarray, values: Tuple[float, ...]):
+        """Write one sample into the next slot; only the processing thread for the camera calls this"""
+        i = self.head
+        self.timestamps[i] = timestamp
+        self.class_counts[i] = class_counts
+        self.values[i] = values
+        self.head = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def _chronological(self, n: int) -> np.ndarray:
+        start = (self.head - n) % self.capacity
+        return (start + np.arange(n)) % self.capacity
+
+    def latest(self, field: str, n: int) -> np.ndarray:
+        """Last n values of a field, oldest first"""
+        n = min(n, self.size)
+        return self.values[self._chronological(n), FIELD_INDEX[field]]
+
+    def window(self, start: Optional[float] = None, end: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """Samples with start <= timestamp < end, oldest first"""
+        order = self._chronological(self.size)
+        timestamps = self.timestamps[order]
+        lo = 0 if start is None else np.searchsorted(timestamps, start, side="left")
+        hi = len(timestamps) if end is None else np.searchsorted(timestamps, end, side="left")
+        rows = order[lo:hi]
+        return {
+            "timestamps": timestamps[lo:hi],
+            "class_counts": self.class_counts[rows],
+            "values": self.values[rows]
+        }
+
+
+class RollupLevel:
+    """Ring of closed buckets at one resolution, each with a sample count and min/max/mean/p95 per field"""
+
+    def __init__(self, seconds: int, capacity: int):
+        self.seconds = seconds
+        self.capacity = capacity
+        self.starts = np.zeros(capacity, dtype=np.float64)
+        self.counts = np.zeros(capacity, dtype=np.int32)
+        self.stats = np.zeros((capacity, len(ROLLUP_STATS), len(SAMPLE_FIELDS)), dtype=np.float32)
+        self.head = 0
+        self.size = 0
+
+    def append(self, start: float, count: int, stats: np.ndarray):
+        i = self.head
+        self.starts[i] = start
+        self.counts[i] = count
+        self.stats[i] = stats
+        self.head = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def last(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Counts and stats of the last n buckets, oldest first"""
+        rows = (self.head - n + np.arange(n)) % self.capacity
+        return self.counts[rows], self.stats[rows]
+
+    def oldest_start(self) -> Optional[float]:
+        if not self.size:
+            return None
+        return float(self.starts[(self.head - self.size) % self.capacity])
+
+    def window(self, start: float, end: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Buckets with start <= bucket start < end, oldest first"""
+        rows = (self.head - self.size + np.arange(self.size)) % self.capacity
+        starts = self.starts[rows]
+        lo = np.searchsorted(starts, start, side="left")
+        hi = np.searchsorted(starts, end, side="left")
+        rows = rows[lo:hi]
+        return starts[lo:hi], self.counts[rows], self.stats[rows]
+
+
+class MetricsHistory(MetricsRingBuffer):
+    """Raw sample ring plus incrementally maintained 1 s / 1 min / 1 h rollups"""
+
+    def __init__(self, capacity: int, n_classes: int, levels: Tuple[Tuple[int, int], ...] = ROLLUP_LEVELS,
+                 sink: Optional[Callable[[float, int, np.ndarray, np.ndarray], None]] = None):
+        super().__init__(capacity, n_classes)
+        self.levels = [RollupLevel(seconds, retained) for seconds, retained in levels]
+        # Called with every closed finest-level bucket and its mean class counts, e.g. to hand it to the
+        # persistence writer
+        self.sink = sink
+        # Start and number of children (raw samples for level 0) of each level's open bucket
+        self.open_start = [None] * len(self.levels)
+        self.open_children = [0] * len(self.levels)
+
+    def append(self, timestamp: float, class_counts: np.ndarray, values: Tuple[float, ...]):
+        bucket_start = timestamp - timestamp % self.levels[0].seconds
+        if self.open_start[0] is not None and bucket_start != self.open_start[0]:
+            self._close(0)
+        super().append(timestamp, class_counts, values)
+        self.open_start[0] = bucket_start
+        self.open_children[0] += 1
+
+    def _close(self, level: int):
+        """Finalize the open bucket of a level and fold it into the next coarser one"""
+        n = self.open_children[level]
+        if level == 0:
+            rows = self._chronological(min(n, self.size))
+            samples = self.values[rows]
+            class_means = self.class_counts[rows].mean(axis=0)
+            count = len(samples)
+            stats = np.stack([
+                samples.min(axis=0), samples.max(axis=0), samples.mean(axis=0),
+                np.percentile(samples, 95, axis=0)
+            ])
+        else:
+            counts, children = self.levels[level - 1].last(n)
+            count = int(counts.sum())
+            # p95 of a coarse bucket is the 95th percentile of its children's p95s (an approximation)
+            stats = np.stack([
+                children[:, 0].min(axis=0), children[:, 1].max(axis=0),
+                (children[:, 2] * counts[:, None]).sum(axis=0) / max(count, 1),
+                np.percentile(children[:, 3], 95, axis=0)
+            ])
+
+        start = self.open_start[level]
+        self.open_start[level] = None
+        self.open_children[level] = 0
+        if level == 0 and self.sink is not None:
+            self.sink(start, count, stats, class_means)
+        self._commit(level, start, count, stats)
+
+    def _commit(self, level: int, start: float, count: int, stats: np.ndarray):
+        """Append a closed bucket to its level, closing the parent bucket first if this one starts a new parent"""
+        parent = level + 1
+        if parent < len(self.levels):
+            parent_start = start - start % self.levels[parent].seconds
+            if self.open_start[parent] is not None and parent_start != self.open_start[parent]:
+                self._close(parent)
+            self.open_start[parent] = parent_start
+            self.open_children[parent] += 1
+
+        self.levels[level].append(start, count, stats)
+
+    def restore(self, starts: np.ndarray, counts: np.ndarray, stats: np.ndarray):
+        """Rebuild rollups from persisted finest-level buckets, oldest first; stats is (n, ROLLUP_STATS, fields)"""
+        for start, count, bucket_stats in zip(starts, counts, stats):
+            self._commit(0, float(start), int(count), bucket_stats)
+
+    def query(self, start: float, end: float, bucket: int, fields: Optional[Tuple[str, ...]] = None) -> Dict:
+        """Re-bucket the finest rollup covering [start, end) into `bucket`-second min/max/mean/p95 columns"""
+        fields = fields or SAMPLE_FIELDS
+        # Finest level that still reaches back to `start` without scanning more than MAX_QUERY_ROWS buckets
+        usable = [lvl for lvl in self.levels if lvl.seconds <= bucket] or self.levels[:1]
+        level = usable[-1]
+        for candidate in usable:
+            oldest = candidate.oldest_start()
+            if oldest is not None and oldest <= start and (end - start) / candidate.seconds <= MAX_QUERY_ROWS:
+                level = candidate
+                break
+
+        starts, counts, stats = level.window(start, end)
+        result = {"bucket": bucket, "resolution": level.seconds, "start": [], "count": []}
+        result.update({field: {stat: [] for stat in ROLLUP_STATS} for field in fields})
+        if not len(starts):
+            return result
+
+        groups = ((starts - start) // bucket).astype(np.int64)
+        edges = np.concatenate([[0], np.flatnonzero(np.diff(groups)) + 1])
+        sizes = np.diff(np.concatenate([edges, [len(groups)]]))
+        totals = np.add.reduceat(counts, edges)
+        mins = np.minimum.reduceat(stats[:, 0], edges, axis=0)
+        maxs = np.maximum.reduceat(stats[:, 1], edges, axis=0)
+        means = np.add.reduceat(stats[:, 2] * counts[:, None], edges, axis=0) / np.maximum(totals, 1)[:, None]
+        # Nearest-rank p95 per group: sort each field within its group, then take one index per group
+        rank = edges + np.ceil(0.95 * sizes).astype(np.int64) - 1
+        p95s = np.empty_like(mins)
+        for f in range(stats.shape[2]):
+            order = np.lexsort((stats[:, 3, f], groups))
+            p95s[:, f] = stats[order, 3, f][rank]
+
+        result["start"] = (start + groups[edges] * bucket).tolist()
+        result["count"] = totals.tolist()
+        for field in fields:
+            f = FIELD_INDEX[field]
+            for stat, column in zip(ROLLUP_STATS, (mins, maxs, means, p95s)):
+                result[field][stat] = np.round(column[:, f].astype(np.float64), 3).tolist()
+        return result
+
+
+class MetricsWriter(threading.Thread):
+    """Background writer that drains closed 1 s buckets from a queue and group-commits them to SQLite"""
+
+    def __init__(self, db_path: str, class_names: Tuple[str, ...] = (), batch_size: int = 500,
+                 flush_interval: float = 2.0):
+        super().__init__(daemon=True, name="MetricsWriter")
+        self.db_path = db_path
+        self.class_names = tuple(class_names)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self._stopped = threading.Event()
+
+    def submit(self, camera_id: int, start: float, count: int, stats: np.ndarray, class_means: np.ndarray):
+        """Enqueue one bucket; never blocks the calling camera thread"""
+        stat_rows = [stats[ROLLUP_STATS.index(stat)] for stat in ("mean",) + PERSISTED_STATS]
+        self.queue.put((camera_id, int(start), count, *np.concatenate(stat_rows).tolist(),
+                        *class_means[:len(self.class_names)].tolist()))
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def stop(self):
+        self._stopped.set()
+        self.queue.put(None)
+        if self.is_alive():
+            self.join(timeout=5)
+
+    def run(self):
+        conn = connect_metrics_db(self.db_path, self.class_names)
+        columns = ["camera_id", "ts", "samples", *stat_columns(), *(f"class_{name}" for name in self.class_names)]
+        insert_sql = (f"INSERT OR REPLACE INTO camera_metrics ({', '.join(columns)}) "
+                      f"VALUES ({', '.join('?' * len(columns))})")
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    item = self.queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline or self._stopped.is_set()):
+                try:
+                    with conn:
+                        conn.executemany(insert_sql, batch)
+                except sqlite3.Error as e:
+                    print(f"❌ Metrics writer failed to persist {len(batch)} samples: {e}")
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+            if self._stopped.is_set() and self.queue.empty():
+                break
+
+        conn.close()
+
+
+def stat_columns() -> list:
+    """Per-field bucket columns: the mean under the bare field name, then one column per PERSISTED_STATS entry"""
+    return list(SAMPLE_FIELDS) + [f"{field}_{stat}" for stat in PERSISTED_STATS for field in SAMPLE_FIELDS]
+
+
+def connect_metrics_db(db_path: str, class_names: Tuple[str, ...] = ()) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    columns = ", ".join(f"{field} REAL" for field in SAMPLE_FIELDS)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS camera_metrics (
+            camera_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            {columns},
+            PRIMARY KEY (camera_id, ts)
+        ) WITHOUT ROWID
+    """)
+    # Stat and class columns are added in place so databases written before they existed keep working
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(camera_metrics)")}
+    for column in stat_columns() + [f"class_{name}" for name in class_names]:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE camera_metrics ADD COLUMN {column} REAL")
+    conn.commit()
+    return conn
+
+
+def load_camera_metrics(db_path: str, camera_id: int, since: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Persisted 1 s buckets for a camera since a timestamp, as (starts, counts, stats)
+
+    stats is (n, ROLLUP_STATS, SAMPLE_FIELDS). Rows written before min/max/p95 were persisted fall
+    back to their mean for those stats.
+    """
+    conn = connect_metrics_db(db_path)
+    try:
+        rows = conn.execute(
+            f"SELECT ts, samples, {', '.join(stat_columns())} FROM camera_metrics "
+            "WHERE camera_id = ? AND ts >= ? ORDER BY ts",
+            (camera_id, int(since))
+        ).fetchall()
+    finally:
+        conn.close()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 2 + len(stat_columns()))
+    persisted = data[:, 2:].reshape(len(data), 1 + len(PERSISTED_STATS), len(SAMPLE_FIELDS))
+    means = persisted[:, 0]
+    by_stat = {"mean": means}
+    for i, stat in enumerate(PERSISTED_STATS):
+        column = persisted[:, i + 1]
+        by_stat[stat] = np.where(np.isnan(column), means, column)
+    stats = np.stack([by_stat[stat] for stat in ROLLUP_STATS], axis=1)
+    return data[:, 0], data[:, 1].astype(np.int64), stats.astype(np.float32)
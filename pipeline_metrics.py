@@ -0,0 +1,254 @@
+import bisect
+import sqlite3
+import threading
+import time
+import weakref
+import numpy as np
+from typing import Callable, Dict, List, Tuple
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Stages timed per camera; capture_to_metrics spans from frame capture to the published metrics update
+PIPELINE_STAGES = ("decode", "resize", "inference", "postprocess", "draw", "metrics", "encode", "capture_to_metrics")
+
+
+# Series are updated without locks: each hot-path series has a single writer thread, and a
+# lost increment from concurrent writers on a shared series is acceptable for monitoring
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        # Only used for rare events such as stream clients connecting, so a lock is affordable
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricFamily:
+    """A named metric with one series per label-value tuple"""
+
+    def __init__(self, name: str, help_text: str, kind: str, label_names: Tuple[str, ...], factory: Callable):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.label_names = label_names
+        self.factory = factory
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> object:
+        """Series for these label values; callers on hot paths should look it up once and keep it"""
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(key, self.factory())
+        return child
+
+
+class Registry:
+    def __init__(self):
+        self.families: List[MetricFamily] = []
+        self.callbacks: List[Tuple[str, str, Callable[[], Dict[Tuple[str, ...], float]], Tuple[str, ...]]] = []
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> MetricFamily:
+        return self._register(MetricFamily(name, help_text, "counter", labels, Counter))
+
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> MetricFamily:
+        return self._register(MetricFamily(name, help_text, "gauge", labels, Gauge))
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> MetricFamily:
+        return self._register(MetricFamily(name, help_text, "histogram", labels, lambda: Histogram(buckets)))
+
+    def gauge_callback(self, name: str, help_text: str, labels: Tuple[str, ...],
+                       collect: Callable[[], Dict[Tuple[str, ...], float]]):
+        """Gauge evaluated at scrape time, e.g. for queue depths owned by other components"""
+        self.callbacks.append((name, help_text, collect, labels))
+
+    def _register(self, family: MetricFamily) -> MetricFamily:
+        self.families.append(family)
+        return family
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for family in self.families:
+            lines.append(f"# HELP {family.name} {family.help_text}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for key, series in list(family.children.items()):
+                labels = _format_labels(family.label_names, key)
+                if family.kind == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(series.bounds, series.counts):
+                        cumulative += count
+                        bucket_labels = _format_labels(family.label_names + ("le",), key + (repr(bound),))
+                        lines.append(f"{family.name}_bucket{bucket_labels} {cumulative}")
+                    inf_labels = _format_labels(family.label_names + ("le",), key + ("+Inf",))
+                    lines.append(f"{family.name}_bucket{inf_labels} {series.count}")
+                    lines.append(f"{family.name}_sum{labels} {series.sum}")
+                    lines.append(f"{family.name}_count{labels} {series.count}")
+                else:
+                    lines.append(f"{family.name}{labels} {series.value}")
+        for name, help_text, collect, label_names in self.callbacks:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in collect().items():
+                lines.append(f"{name}{_format_labels(label_names, key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records one histogram observation per query, covering execution plus fetching its rows
+
+    A query's time is observed when the cursor runs its next statement, is closed or is garbage
+    collected; closing the connection closes out every cursor it handed out.
+    """
+    _elapsed = None
+
+    def _observe(self):
+        if self._elapsed is not None:
+            self.connection.query_latency.observe(self._elapsed)
+            self._elapsed = None
+
+    def _add(self, start: float):
+        self._elapsed = (self._elapsed or 0.0) + time.perf_counter() - start
+
+    def execute(self, sql, parameters=()):
+        self._observe()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._add(start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._add(start)
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._add(start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._add(start)
+
+    def close(self):
+        self._observe()
+        super().close()
+
+    def __del__(self):
+        # One-shot cursors such as conn.execute(...).fetchall() are dropped without being closed
+        try:
+            self._observe()
+        except Exception:
+            pass
+
+
+class TimedConnection(sqlite3.Connection):
+    query_latency = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursors = weakref.WeakSet()
+
+    def cursor(self, factory=TimedCursor):
+        cursor = super().cursor(factory)
+        self._cursors.add(cursor)
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        # The built-in shortcut creates its cursor internally, bypassing cursor() and the timing
+        return self.cursor().execute(sql, parameters)
+
+    def close(self):
+        for cursor in list(self._cursors):
+            cursor._observe()
+        super().close()
+
+
+class StageProfiler:
+    """Rolling windows of per-stage durations; recording is O(1) and percentiles are computed on read"""
+
+    def __init__(self, stages: Tuple[str, ...] = PIPELINE_STAGES, window: int = 1024):
+        self.stages = stages
+        self.window = window
+        self.samples = np.zeros((len(stages), window), dtype=np.float32)
+        self.heads = [0] * len(stages)
+        self.sizes = [0] * len(stages)
+
+    def record(self, stage: int, seconds: float):
+        """Store a duration for a stage index (see PIPELINE_STAGES)"""
+        head = self.heads[stage]
+        self.samples[stage, head] = seconds
+        self.heads[stage] = (head + 1) % self.window
+        if self.sizes[stage] < self.window:
+            self.sizes[stage] += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """p50/p95/p99 in milliseconds for every stage with samples"""
+        result = {}
+        for i, stage in enumerate(self.stages):
+            size = self.sizes[i]
+            if not size:
+                continue
+            p50, p95, p99 = np.percentile(self.samples[i, :size], (50, 95, 99)) * 1000
+            result[stage] = {
+                "p50_ms": round(float(p50), 2),
+                "p95_ms": round(float(p95), 2),
+                "p99_ms": round(float(p99), 2),
+                "samples": size
+            }
+        return result
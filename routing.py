@@ -0,0 +1,293 @@
+import argparse
+import heapq
+import math
+import os
+import threading
+import xml.etree.ElementTree as ET
+import numpy as np
+from scipy.spatial import cKDTree
+from typing import Dict, List, Optional, Tuple
+from geo import EARTH_RADIUS_KM, chord_from_km, haversine_km, to_unit_xyz
+
+# Default speeds (km/h) for routable OSM highway types when a way has no usable maxspeed tag
+HIGHWAY_SPEEDS = {
+    "motorway": 80, "trunk": 60, "primary": 50, "secondary": 40, "tertiary": 35,
+    "motorway_link": 50, "trunk_link": 40, "primary_link": 35, "secondary_link": 30, "tertiary_link": 30,
+    "unclassified": 25, "residential": 20, "living_street": 10, "service": 15, "road": 25
+}
+MAX_SNAP_KM = 2.0  # farthest a query point may be from the nearest graph node
+CAMERA_EDGE_RADIUS_KM = 0.15  # edges touching a node this close to a camera take its congestion
+
+
+def _maxspeed(tag: Optional[str], default: float) -> float:
+    if not tag:
+        return default
+    try:
+        value = float(tag.split()[0])
+    except ValueError:
+        return default
+    return value * 1.609 if "mph" in tag else value
+
+
+def _oneway(tags: Dict[str, str]) -> int:
+    """1 for forward-only, -1 for reverse-only, 0 for two-way"""
+    value = tags.get("oneway", "")
+    if value in ("yes", "true", "1") or tags.get("highway") == "motorway" or tags.get("junction") == "roundabout":
+        return 1
+    return -1 if value == "-1" else 0
+
+
+class RoadGraph:
+    """Directed road network in CSR form: out-edges per node for forward search, in-edges for backward search
+
+    Both adjacency structures index into the same edge arrays, so a path found from either side maps
+    back to the same edge ids. Live travel times are free-flow times scaled by per-edge multipliers,
+    which cameras update in place without touching the adjacency.
+    """
+
+    def __init__(self, lat: np.ndarray, lng: np.ndarray, tails: np.ndarray, heads: np.ndarray,
+                 length_m: np.ndarray, duration_s: np.ndarray):
+        self.lat = lat
+        self.lng = lng
+        self.tails = tails
+        self.heads = heads
+        self.length_m = length_m
+        self.duration_s = duration_s
+        n = len(lat)
+
+        out_order = np.argsort(tails, kind="stable")
+        self.out_ptr = np.concatenate([[0], np.cumsum(np.bincount(tails, minlength=n))])
+        self.out_edges = out_order
+        in_order = np.argsort(heads, kind="stable")
+        self.in_ptr = np.concatenate([[0], np.cumsum(np.bincount(heads, minlength=n))])
+        self.in_edges = in_order
+
+        self.max_speed_mps = float(np.max(length_m / np.maximum(duration_s, 1e-9))) if len(length_m) else 1.0
+        self.xyz = to_unit_xyz(lat, lng)
+        self.tree = cKDTree(self.xyz)
+        # Plain lists make the per-node inner loop of the search much faster than numpy scalar indexing
+        self._lists = (self.out_ptr.tolist(), self.out_edges.tolist(), self.in_ptr.tolist(), self.in_edges.tolist(),
+                       self.tails.tolist(), self.heads.tolist(), self.xyz.tolist())
+        self._costs = {"free_flow": duration_s.tolist(), "duration": duration_s.tolist(), "length": length_m.tolist()}
+
+        self.multipliers = np.ones(len(tails))
+        self.camera_edges: Dict[int, np.ndarray] = {}
+        self._camera_factor: Dict[int, float] = {}
+        self._edge_cameras: Dict[int, List[int]] = {}
+        self._traffic_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def save(self, path: str):
+        np.savez_compressed(path, lat=self.lat, lng=self.lng, tails=self.tails, heads=self.heads,
+                            length_m=self.length_m, duration_s=self.duration_s)
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        data = np.load(path)
+        return cls(data["lat"], data["lng"], data["tails"], data["heads"], data["length_m"], data["duration_s"])
+
+    def nearest_node(self, lat: float, lng: float) -> Tuple[int, float]:
+        chord, node = self.tree.query(to_unit_xyz(lat, lng)[0])
+        return int(node), 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+    def attach_camera(self, camera_id: int, lat: float, lng: float,
+                      radius_km: float = CAMERA_EDGE_RADIUS_KM) -> np.ndarray:
+        """Map a camera onto the edges touching nodes within radius_km of it, or its nearest node's edges"""
+        nodes = self.tree.query_ball_point(to_unit_xyz(lat, lng)[0], chord_from_km(radius_km))
+        if not nodes:
+            node, gap = self.nearest_node(lat, lng)
+            nodes = [node] if gap <= MAX_SNAP_KM else []
+        edges = np.unique(np.concatenate(
+            [self.out_edges[self.out_ptr[n]:self.out_ptr[n + 1]] for n in nodes] +
+            [self.in_edges[self.in_ptr[n]:self.in_ptr[n + 1]] for n in nodes] + [np.empty(0, dtype=np.int64)]
+        ))
+        with self._traffic_lock:
+            self.camera_edges[camera_id] = edges
+            self._camera_factor[camera_id] = 1.0
+            for e in edges.tolist():
+                self._edge_cameras.setdefault(e, []).append(camera_id)
+        return edges
+
+    def set_camera_congestion(self, camera_id: int, factor: float):
+        """Scale travel time on a camera's edges; costs O(edges mapped to that camera)
+
+        An edge seen by several cameras takes the largest factor. Factors below 1 are clamped so
+        no edge gets faster than free flow, which the A* lower bound relies on.
+        """
+        edges = self.camera_edges.get(camera_id)
+        factor = max(float(factor), 1.0)
+        if edges is None or self._camera_factor[camera_id] == factor:
+            return
+        live = self._costs["duration"]
+        free = self._costs["free_flow"]
+        with self._traffic_lock:
+            self._camera_factor[camera_id] = factor
+            for e in edges.tolist():
+                multiplier = max(self._camera_factor[c] for c in self._edge_cameras[e])
+                self.multipliers[e] = multiplier
+                live[e] = free[e] * multiplier
+
+    def shortest_path(self, source: int, target: int, weight: str = "duration") -> Optional[Tuple[float, List[int]]]:
+        """Bidirectional A* with averaged potentials; returns (cost, edge ids in order) or None if unreachable
+
+        weight is "duration" (live travel time), "free_flow" (travel time ignoring congestion) or "length".
+        """
+        if source == target:
+            return 0.0, []
+        out_ptr, out_edges, in_ptr, in_edges, tails, heads, xyz = self._lists
+        costs = self._costs[weight]
+        # Lower bound on cost per metre: straight-line distance at the fastest free-flow speed in the graph
+        per_metre = 1.0 if weight == "length" else 1.0 / self.max_speed_mps
+        radius_m = EARTH_RADIUS_KM * 1000
+        sx, sy, sz = xyz[source]
+        tx, ty, tz = xyz[target]
+
+        potentials = {}
+
+        def potential(v: int) -> float:
+            # (h_target - h_source) / 2 keeps both searches' reduced costs non-negative
+            p = potentials.get(v)
+            if p is None:
+                x, y, z = xyz[v]
+                to_target = 2 * math.asin(min(math.sqrt((x - tx) ** 2 + (y - ty) ** 2 + (z - tz) ** 2) / 2, 1.0))
+                from_source = 2 * math.asin(min(math.sqrt((x - sx) ** 2 + (y - sy) ** 2 + (z - sz) ** 2) / 2, 1.0))
+                p = potentials[v] = (to_target - from_source) * radius_m * per_metre / 2
+            return p
+
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: -1}, {target: -1})  # edge used to reach each node
+        settled = (set(), set())
+        heaps = ([(potential(source), source)], [(-potential(target), target)])
+        best = math.inf
+        meeting = -1
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            _, u = heapq.heappop(heaps[side])
+            if u in settled[side]:
+                continue
+            settled[side].add(u)
+            d_u = dist[side][u]
+            other = dist[1 - side]
+            if side == 0:
+                ptr, edges, ends, sign = out_ptr, out_edges, heads, 1.0
+            else:
+                ptr, edges, ends, sign = in_ptr, in_edges, tails, -1.0
+            for k in range(ptr[u], ptr[u + 1]):
+                e = edges[k]
+                v = ends[e]
+                d_v = d_u + costs[e]
+                if d_v < dist[side].get(v, math.inf):
+                    dist[side][v] = d_v
+                    parent[side][v] = e
+                    heapq.heappush(heaps[side], (d_v + sign * potential(v), v))
+                    if v in other and d_v + other[v] < best:
+                        best = d_v + other[v]
+                        meeting = v
+
+        if meeting < 0:
+            return None
+        path = []
+        v = meeting
+        while parent[0][v] >= 0:
+            e = parent[0][v]
+            path.append(e)
+            v = tails[e]
+        path.reverse()
+        v = meeting
+        while parent[1][v] >= 0:
+            e = parent[1][v]
+            path.append(e)
+            v = heads[e]
+        return best, path
+
+    def route(self, start_lat: float, start_lng: float, end_lat: float, end_lng: float) -> Optional[Dict]:
+        """Fastest route under live traffic as geometry, distance (km) and duration (minutes)"""
+        source, source_gap = self.nearest_node(start_lat, start_lng)
+        target, target_gap = self.nearest_node(end_lat, end_lng)
+        if source_gap > MAX_SNAP_KM or target_gap > MAX_SNAP_KM:
+            return None
+        found = self.shortest_path(source, target)
+        if found is None:
+            return None
+        duration, edges = found
+        edges = np.asarray(edges, dtype=np.int64)
+        nodes = np.concatenate([[source], self.heads[edges]]) if len(edges) else np.array([source])
+        return {
+            "coordinates": np.stack([self.lat[nodes], self.lng[nodes]], axis=1).tolist(),
+            "distance": float(self.length_m[edges].sum()) / 1000,
+            "duration": duration / 60,
+            "free_flow_duration": float(self.duration_s[edges].sum()) / 60,
+            "steps": len(edges)
+        }
+
+
+def parse_osm(path: str) -> RoadGraph:
+    """Build a RoadGraph from the routable highways in an OSM XML extract"""
+    node_coords = {}
+    ways = []
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag == "node":
+            node_coords[int(element.get("id"))] = (float(element.get("lat")), float(element.get("lon")))
+            element.clear()
+        elif element.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+            highway = tags.get("highway")
+            if highway in HIGHWAY_SPEEDS:
+                refs = [int(nd.get("ref")) for nd in element.iter("nd")]
+                ways.append((refs, _oneway(tags), _maxspeed(tags.get("maxspeed"), HIGHWAY_SPEEDS[highway])))
+            element.clear()
+
+    # Keep only nodes that routable ways reference, renumbered densely
+    index = {}
+    tails, heads, speeds = [], [], []
+    for refs, oneway, speed in ways:
+        refs = [ref for ref in refs if ref in node_coords]
+        ids = [index.setdefault(ref, len(index)) for ref in refs]
+        for a, b in zip(ids, ids[1:]):
+            if oneway >= 0:
+                tails.append(a)
+                heads.append(b)
+                speeds.append(speed)
+            if oneway <= 0:
+                tails.append(b)
+                heads.append(a)
+                speeds.append(speed)
+
+    coords = np.array([node_coords[ref] for ref in index], dtype=np.float64).reshape(-1, 2)
+    tails = np.array(tails, dtype=np.int64)
+    heads = np.array(heads, dtype=np.int64)
+    length_m = haversine_km(coords[tails, 0], coords[tails, 1], coords[heads, 0], coords[heads, 1]) * 1000
+    duration_s = length_m / (np.array(speeds, dtype=np.float64) / 3.6)
+    return RoadGraph(coords[:, 0], coords[:, 1], tails, heads, length_m, duration_s)
+
+
+def load_road_graph(path: str) -> RoadGraph:
+    """Load an .osm extract, reusing a compiled .npz next to it when that is newer than the extract"""
+    if path.endswith(".npz"):
+        return RoadGraph.load(path)
+    compiled = path + ".npz"
+    if os.path.exists(compiled) and os.path.getmtime(compiled) >= os.path.getmtime(path):
+        return RoadGraph.load(compiled)
+    graph = parse_osm(path)
+    graph.save(compiled)
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile an OSM extract into a routing graph")
+    parser.add_argument("osm", help="OSM XML extract")
+    parser.add_argument("-o", "--output", default=None, help="Output .npz (default: <osm>.npz)")
+    args = parser.parse_args()
+
+    graph = parse_osm(args.osm)
+    graph.save(args.output or args.osm + ".npz")
+    print(f"✅ {len(graph)} nodes, {len(graph.tails)} edges")
+
+
+if __name__ == "__main__":
+    main()
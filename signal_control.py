@@ -0,0 +1,275 @@
+import math
+import threading
+import time
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+GREEN, AMBER, RED = range(3)
+PHASE_NAMES = ("green", "amber", "red")
+
+
+def _wrap(values: np.ndarray, cycle: float) -> np.ndarray:
+    """Map times onto (-cycle/2, cycle/2]"""
+    return cycle / 2 - np.mod(cycle / 2 - values, cycle)
+
+
+def progression_bandwidth(offsets: np.ndarray, greens: np.ndarray, travel: np.ndarray, cycle: float) -> float:
+    """Width of the green band a platoon can ride through every junction, seen from the first one"""
+    starts = _wrap(offsets - travel - offsets[0], cycle)
+    return float(max(0.0, np.min(starts + greens) - np.max(starts)))
+
+
+def optimize_corridor(distances_m: np.ndarray, forward_flow: np.ndarray, reverse_flow: np.ndarray,
+                      isolated_green: np.ndarray, red_time: float, speed_kmh: float,
+                      min_cycle: float, max_cycle: float) -> Dict:
+    """Common cycle, splits and offsets for junctions listed in corridor order
+
+    distances_m holds the n-1 gaps between consecutive junctions. Flows are vehicles per
+    minute in the corridor's forward and reverse directions at each junction.
+    """
+    isolated_green = np.asarray(isolated_green, dtype=np.float64)
+    n = len(isolated_green)
+
+    # The critical junction sets the common cycle; others keep their isolated green:red ratio
+    cycle = float(np.clip(np.max(isolated_green + red_time), min_cycle, max_cycle))
+    greens = cycle * isolated_green / (isolated_green + red_time)
+
+    # Travel time from the first junction, and each direction's ideal offset aligning green midpoints
+    travel = np.concatenate([[0.0], np.cumsum(distances_m)]) / (speed_kmh / 3.6)
+    centering = (greens[0] - greens) / 2
+    ideal_forward = np.mod(travel + centering, cycle)
+    ideal_reverse = np.mod(-travel + centering, cycle)
+
+    # Flow-weighted circular mean of the two ideals at each junction
+    weight_f = np.asarray(forward_flow, dtype=np.float64) + 1e-9
+    weight_r = np.asarray(reverse_flow, dtype=np.float64) + 1e-9
+    to_angle = 2 * np.pi / cycle
+    x = weight_f * np.cos(ideal_forward * to_angle) + weight_r * np.cos(ideal_reverse * to_angle)
+    y = weight_f * np.sin(ideal_forward * to_angle) + weight_r * np.sin(ideal_reverse * to_angle)
+    offsets = np.mod(np.arctan2(y, x) / to_angle, cycle) if n > 1 else np.zeros(1)
+    offsets[0] = 0.0
+
+    return {
+        "cycle": cycle,
+        "greens": greens,
+        "offsets": offsets,
+        "bandwidth": {
+            "forward": progression_bandwidth(offsets, greens, travel, cycle),
+            "reverse": progression_bandwidth(offsets[::-1], greens[::-1], travel[-1] - travel[::-1], cycle)
+        }
+    }
+
+
+def webster_timing(flow_ratios: np.ndarray, lost_time: float, min_cycle: float, max_cycle: float,
+                   max_saturation: float = 0.9) -> Tuple[float, np.ndarray]:
+    """Webster's optimal cycle (1.5L + 5) / (1 - Y) and effective greens split in proportion to flow ratios"""
+    ratios = np.clip(np.asarray(flow_ratios, dtype=np.float64), 0.0, None)
+    total = ratios.sum()
+    # Near or over saturation the formula diverges; cap Y so the cycle saturates at max_cycle instead
+    cycle = float(np.clip((1.5 * lost_time + 5) / (1 - min(total, max_saturation)), min_cycle, max_cycle))
+    effective = cycle - lost_time
+    greens = effective * ratios / total if total > 0 else np.full(len(ratios), effective / len(ratios))
+    return cycle, greens
+
+
+def corridor_plans(name: str, camera_ids: List[int], plan: Dict, computed_at: float,
+                   epoch: float) -> Dict[int, Dict]:
+    """Split a corridor solution into the per-camera plans published with each location's metrics
+
+    epoch is when the first junction's green starts; each plan's green_start is epoch + offset, an
+    absolute time from which that junction's greens repeat every cycle.
+    """
+    return {
+        camera_id: {
+            "corridor": name,
+            "cycle": round(plan["cycle"], 1),
+            "green": round(float(plan["greens"][i]), 1),
+            "offset": round(float(plan["offsets"][i]), 1),
+            "green_start": epoch + round(float(plan["offsets"][i]), 1),
+            "bandwidth": {direction: round(value, 1) for direction, value in plan["bandwidth"].items()},
+            "computed_at": computed_at
+        } for i, camera_id in enumerate(camera_ids)
+    }
+
+
+def _round_like_python(values: np.ndarray, digits: int) -> np.ndarray:
+    """np.round, with exact Python round() for the few values whose scaled fraction sits near .5"""
+    rounded = np.round(values, digits)
+    scaled = values * 10 ** digits
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_half):
+        rounded[i] = round(float(values[i]), digits)
+    return rounded
+
+
+def batch_signal_timing(vehicle_counts: np.ndarray, waiting_times: np.ndarray, histories: np.ndarray,
+                        config: Dict, car_emission: float, pcu_loads: Optional[np.ndarray] = None,
+                        emission_loads: Optional[np.ndarray] = None,
+                        forecast_loads: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Array form of calculate_smart_signal_timing for many junctions, matching it value for value
+
+    histories is (junctions, k), right-aligned with NaN padding for junctions with fewer than k
+    entries. Arithmetic is ordered as in the scalar function so results are bit-identical.
+    """
+    counts = np.asarray(vehicle_counts, dtype=np.float64)
+    waiting = np.asarray(waiting_times, dtype=np.float64)
+    histories = np.asarray(histories, dtype=np.float64).reshape(len(counts), -1)
+    load = counts if pcu_loads is None else np.asarray(pcu_loads, dtype=np.float64)
+    base_green = config["base_green"]
+    min_green = config["min_green"]
+    max_green = config["max_green"]
+    red_time = config["red_time"]
+    increment = config["vehicle_increment"]
+    max_penalty = config["max_waiting_penalty"]
+
+    green = np.select(
+        [load == 0, load <= 5, load <= 15],
+        [min_green, base_green, base_green + (load - 5) * increment],
+        base_green + 10 * increment + np.minimum((load - 15) * 0.5, max_penalty)
+    ).astype(np.float64)
+
+    green = np.where(waiting > red_time, green + np.minimum((waiting - red_time) * 0.5, max_penalty), green)
+
+    if histories.shape[1] >= 3:
+        lengths = np.count_nonzero(~np.isnan(histories), axis=1)
+        last = histories[:, -3:]
+        recent_avg = (last[:, 0] + last[:, 1] + last[:, 2]) / 3
+        apply_trend = (lengths > 3) & (recent_avg > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            trend = np.minimum(np.maximum(load / recent_avg, 0.8), 1.2)
+        green = np.where(apply_trend, green * trend, green)
+
+    if forecast_loads is not None:
+        forecast = np.asarray(forecast_loads, dtype=np.float64)
+        extension = np.minimum((forecast - load) * increment * config["forecast_weight"],
+                               config["max_forecast_extension"])
+        green = np.where(forecast > load, green + extension, green)
+
+    green = np.trunc(np.maximum(min_green, np.minimum(green, max_green))).astype(np.int64)
+    waiting_out = np.trunc(np.maximum(0, waiting)).astype(np.int64)
+
+    cycle = green + red_time
+    efficiency = green / cycle
+    efficiency_factor = np.minimum(efficiency * 1.2, 1.0)
+    if emission_loads is None:
+        vehicle_co2 = counts * 0.08
+    else:
+        vehicle_co2 = np.asarray(emission_loads, dtype=np.float64) * 0.08 / car_emission
+    co2 = vehicle_co2 * efficiency_factor
+    co2 = np.where((load > 10) & (green < max_green), co2 * 1.1, co2)
+
+    return {
+        "signal_time": green,
+        "waiting_time": waiting_out,
+        "co2_reduction": _round_like_python(co2, 2),
+        "efficiency_ratio": _round_like_python(efficiency, 2),
+        "cycle_time": cycle
+    }
+
+
+class SignalPhaseScheduler(threading.Thread):
+    """Runs the green/amber/red cycle of every junction from one thread using a hashed timer wheel
+
+    Each junction sits in the wheel slot of its next transition, so a tick only touches junctions
+    whose phase actually ends. New green (and, if red_time is callable, red) times are read only
+    at each cycle start.
+
+    anchor, when it returns (green_start, cycle) for a junction, locks that junction to a fixed grid:
+    its red is stretched so every green starts at green_start + k * cycle, which is how corridor
+    offsets are executed. red_time is ignored for anchored junctions; min_red still applies.
+    """
+
+    def __init__(self, n_junctions: int, green_time: Callable[[int], float], amber_time: float,
+                 red_time: Union[float, Callable[[int], float]],
+                 on_phase: Optional[Callable[[int, int, float], None]] = None,
+                 tick: float = 0.1, wheel_size: int = 1024,
+                 anchor: Optional[Callable[[int], Optional[Tuple[float, float]]]] = None, min_red: float = 0.0):
+        super().__init__(daemon=True, name="SignalPhaseScheduler")
+        self.green_time = green_time
+        self.amber_time = amber_time
+        self.red_time = red_time
+        self.on_phase = on_phase
+        self.anchor = anchor
+        self.min_red = min_red
+        self.tick = tick
+        self.wheel = [[] for _ in range(wheel_size)]
+        self.phase = np.full(n_junctions, GREEN, dtype=np.int8)
+        self.phase_started = np.zeros(n_junctions)
+        self.phase_ends = np.zeros(n_junctions)
+        self.cycle_started = np.zeros(n_junctions)
+        self.cycle_green = np.zeros(n_junctions)
+        self.cycle_red = np.zeros(n_junctions)
+        self.origin = time.time()
+        self.current_tick = 0
+        self._stopped = threading.Event()
+
+    def _schedule(self, idx: int, when: float):
+        due = max(math.ceil((when - self.origin) / self.tick), self.current_tick + 1)
+        self.wheel[due % len(self.wheel)].append((due, idx))
+
+    def _next_anchored_green(self, idx: int, earliest: float) -> Optional[float]:
+        """First grid point of an anchored junction at or after `earliest`, or None if it is not anchored"""
+        grid = self.anchor(idx) if self.anchor is not None else None
+        if grid is None:
+            return None
+        green_start, cycle = grid
+        return green_start + math.ceil((earliest - green_start) / cycle - 1e-9) * cycle
+
+    def _enter(self, idx: int, phase: int, now: float):
+        if phase == GREEN:
+            duration = float(self.green_time(idx))
+            self.cycle_started[idx] = now
+            self.cycle_green[idx] = duration
+            next_green = self._next_anchored_green(idx, now + duration + self.amber_time + self.min_red)
+            if next_green is not None:
+                self.cycle_red[idx] = next_green - now - duration - self.amber_time
+            else:
+                self.cycle_red[idx] = self.red_time(idx) if callable(self.red_time) else self.red_time
+        else:
+            duration = self.amber_time if phase == AMBER else float(self.cycle_red[idx])
+        self.phase[idx] = phase
+        self.phase_started[idx] = now
+        self.phase_ends[idx] = now + duration
+        self._schedule(idx, now + duration)
+        if self.on_phase is not None:
+            self.on_phase(idx, phase, now)
+
+    def run(self):
+        now = time.time()
+        for idx in range(len(self.phase)):
+            # Anchored junctions hold red until their first grid point so they start in step
+            first_green = self._next_anchored_green(idx, now)
+            if first_green is not None and first_green > now:
+                self.cycle_red[idx] = first_green - now
+                self._enter(idx, RED, now)
+            else:
+                self._enter(idx, GREEN, now)
+
+        while not self._stopped.is_set():
+            target = int((time.time() - self.origin) / self.tick)
+            # Catch up on every tick missed while sleeping so no transition is skipped
+            while self.current_tick < target:
+                self.current_tick += 1
+                slot = self.wheel[self.current_tick % len(self.wheel)]
+                due = [entry for entry in slot if entry[0] <= self.current_tick]
+                if not due:
+                    continue
+                slot[:] = [entry for entry in slot if entry[0] > self.current_tick]
+                for _, idx in due:
+                    # Transitions are stamped with their scheduled end so cycles don't drift with tick jitter
+                    self._enter(idx, (self.phase[idx] + 1) % len(PHASE_NAMES), float(self.phase_ends[idx]))
+            self._stopped.wait(self.origin + (self.current_tick + 1) * self.tick - time.time())
+
+    def stop(self):
+        self._stopped.set()
+
+    def state(self, idx: int, now: Optional[float] = None) -> Dict:
+        """Current phase of a junction and the seconds left in it"""
+        now = time.time() if now is None else now
+        return {
+            "phase": PHASE_NAMES[self.phase[idx]],
+            "remaining": round(max(float(self.phase_ends[idx]) - now, 0.0), 1),
+            "cycle_start": float(self.cycle_started[idx]),
+            "green_time": float(self.cycle_green[idx]),
+            "cycle_time": float(self.cycle_green[idx] + self.cycle_red[idx]) + self.amber_time
+        }
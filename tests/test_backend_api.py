@@ -0,0 +1,46 @@
+import pytest
+
+# backend imports the detection stack at module level
+pytest.importorskip("cv2")
+pytest.importorskip("ultralytics")
+pytest.importorskip("jwt")
+
+from fastapi.testclient import TestClient
+
+import backend
+
+client = TestClient(backend.app)
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_export_rejects_citizen_tokens():
+    token = backend.create_jwt_token(1, "admin")  # a citizen account may share a staff username
+    response = client.get("/export/trips", headers=bearer(token))
+    assert response.status_code == 403
+
+
+def test_export_rejects_staff_without_export_permission():
+    token = backend.create_jwt_token(None, "traffic_controller", "controller")
+    response = client.get("/export/trips", headers=bearer(token))
+    assert response.status_code == 403
+
+
+def test_export_allows_authority_staff():
+    login = client.post("/api/staff-login", json={"username": "admin", "password": "admin123"})
+    assert login.status_code == 200
+    response = client.get("/export/trips", params={"format": "arrow"}, headers=bearer(login.json()["token"]))
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("body", [
+    {"camera_id": 1, "hours": -1},
+    {"camera_id": 1, "hours": 0},
+    {"camera_id": 1, "hours": backend.MAX_SIMULATION_HOURS + 1},
+    {"camera_id": 1, "demand_scale": 0},
+    {"camera_id": 1, "demand_scale": backend.MAX_DEMAND_SCALE + 1},
+])
+def test_simulate_rejects_out_of_range_parameters(body):
+    assert client.post("/api/simulate", json=body).status_code == 422
@@ -0,0 +1,95 @@
+import sys
+import threading
+
+import orjson
+
+from metrics_feed import MetricsPublisher
+
+
+def payload(vehicles: int, last_update: float) -> dict:
+    return {"vehicles": vehicles, "status": "Low", "bottleneck": "No", "last_update": last_update, "pcu": 1.0,
+            "signal_time": 30, "waiting_time": 0, "queue_length": 0, "co2": 0.0, "detection_confidence": 0.9,
+            "flow": {}}
+
+
+def test_etag_identifies_the_payload_across_publishers():
+    first = MetricsPublisher(1)
+    first.publish(0, payload(3, 100.0))
+    body, etag = first.document(101.0)
+    assert first.document(101.5) == (body, etag)
+
+    # A fresh process starts its counters over; the same tag must not label different content
+    restarted = MetricsPublisher(1)
+    restarted.publish(0, payload(7, 100.0))
+    other_body, other_etag = restarted.document(101.0)
+    assert other_body != body and other_etag != etag
+
+    replay = MetricsPublisher(1)
+    replay.publish(0, payload(3, 100.0))
+    assert replay.document(101.0) == (body, etag)
+
+
+def publish_concurrently(cameras: int) -> dict:
+    """Publish once to every camera from its own thread while a reader follows changes(); returns what it saw"""
+    publisher = MetricsPublisher(cameras)
+    seen = {}
+    done = threading.Event()
+    start = threading.Barrier(cameras + 1)
+
+    def produce(idx: int):
+        start.wait()
+        publisher.publish(idx, payload(idx + 1, 100.0))
+
+    def consume():
+        since = 0
+        start.wait()
+        while True:
+            finished = done.is_set()
+            since, body = publisher.changes(since)
+            for location in orjson.loads(body):
+                seen[location["camera_id"]] = location["vehicles"]
+            if finished:
+                return
+
+    reader = threading.Thread(target=consume)
+    writers = [threading.Thread(target=produce, args=(idx,)) for idx in range(cameras)]
+    reader.start()
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    done.set()
+    reader.join()
+    return seen
+
+
+def test_changes_never_skips_a_concurrent_publish():
+    # Switch threads as often as possible so a publish is interrupted between its steps
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for _ in range(30):
+            # A cursor that ran ahead of a slower writer's entry would never deliver that camera
+            assert publish_concurrently(32) == {idx + 1: idx + 1 for idx in range(32)}
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def test_events_are_recorded_in_sequence_order():
+    publisher = MetricsPublisher(1)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        writers = [threading.Thread(target=lambda: [publisher.publish_event("anomaly", {"n": n}) for n in range(100)])
+                   for _ in range(8)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    # A cursor advanced to the newest seq must not have skipped an event appended later with a lower one
+    seqs = [event[0] for event in publisher.events_since(0)]
+    assert seqs == sorted(seqs) and len(seqs) == 800
+    assert publisher.event_seq == seqs[-1]
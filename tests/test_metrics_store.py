@@ -0,0 +1,65 @@
+import sqlite3
+
+import numpy as np
+
+from metrics_store import MetricsHistory, MetricsWriter, ROLLUP_STATS, SAMPLE_FIELDS, load_camera_metrics
+
+
+def fill(history: MetricsHistory, start: float, seconds: int, rate: int, rng: np.random.Generator):
+    for i in range(seconds * rate):
+        values = rng.uniform(0, 10, len(SAMPLE_FIELDS))
+        history.append(start + i / rate, rng.integers(0, 5, 4), tuple(values))
+
+
+def test_restart_restores_full_bucket_stats(tmp_path):
+    db_path = str(tmp_path / "metrics.db")
+    writer = MetricsWriter(db_path, ("car", "motorbike", "bus", "truck"), flush_interval=0.05)
+    writer.start()
+    live = MetricsHistory(10000, 4, sink=lambda *bucket: writer.submit(1, *bucket))
+    fill(live, 1000.0, 120, 4, np.random.default_rng(0))
+    writer.stop()
+
+    restored = MetricsHistory(10000, 4)
+    restored.restore(*load_camera_metrics(db_path, 1, 0))
+
+    expected = live.query(1000.0, 1119.0, 60)
+    actual = restored.query(1000.0, 1119.0, 60)
+    assert actual["count"] == expected["count"]
+    for field in SAMPLE_FIELDS:
+        for stat in ROLLUP_STATS:
+            np.testing.assert_allclose(actual[field][stat], expected[field][stat], atol=1e-3)
+
+
+def test_class_counts_are_persisted(tmp_path):
+    db_path = str(tmp_path / "metrics.db")
+    writer = MetricsWriter(db_path, ("car", "motorbike", "bus", "truck"), flush_interval=0.05)
+    writer.start()
+    history = MetricsHistory(100, 4, sink=lambda *bucket: writer.submit(1, *bucket))
+    history.append(10.0, np.array([2, 0, 1, 0]), (3,) * len(SAMPLE_FIELDS))
+    history.append(10.5, np.array([4, 0, 1, 0]), (5,) * len(SAMPLE_FIELDS))
+    history.append(11.0, np.array([0, 0, 0, 0]), (0,) * len(SAMPLE_FIELDS))
+    writer.stop()
+
+    conn = sqlite3.connect(db_path)
+    row = conn.execute("SELECT class_car, class_bus FROM camera_metrics WHERE ts = 10").fetchone()
+    conn.close()
+    assert row == (3.0, 1.0)
+
+
+def test_rows_without_persisted_stats_fall_back_to_mean(tmp_path):
+    db_path = str(tmp_path / "metrics.db")
+    conn = sqlite3.connect(db_path)
+    columns = ", ".join(f"{field} REAL" for field in SAMPLE_FIELDS)
+    conn.execute(f"CREATE TABLE camera_metrics (camera_id INTEGER NOT NULL, ts INTEGER NOT NULL, "
+                 f"samples INTEGER NOT NULL, {columns}, PRIMARY KEY (camera_id, ts)) WITHOUT ROWID")
+    conn.execute(f"INSERT INTO camera_metrics VALUES (1, 5, 2, {', '.join('7.5' for _ in SAMPLE_FIELDS)})")
+    conn.commit()
+    conn.close()
+
+    starts, counts, stats = load_camera_metrics(db_path, 1, 0)
+    assert starts.tolist() == [5.0] and counts.tolist() == [2]
+    assert np.all(stats == 7.5)
+
+
+def test_stop_without_start():
+    MetricsWriter(":memory:").stop()
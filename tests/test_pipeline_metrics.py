@@ -0,0 +1,33 @@
+import sqlite3
+
+from pipeline_metrics import Registry, TimedConnection
+
+
+def connect(registry: Registry):
+    histogram = registry.histogram("query_seconds", "Query latency", ("endpoint",))
+    conn = sqlite3.connect(":memory:", factory=TimedConnection)
+    conn.query_latency = histogram.labels("test")
+    return conn, conn.query_latency
+
+
+def test_one_observation_per_query():
+    conn, series = connect(Registry())
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE t (x INTEGER)")
+    cursor.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(10)])
+    cursor.execute("SELECT x FROM t")
+    cursor.fetchone()
+    cursor.fetchmany(3)
+    cursor.fetchall()
+    cursor.execute("SELECT COUNT(*) FROM t")
+    assert cursor.fetchone() == (10,)
+    conn.close()
+    # CREATE, SELECT with three fetches, SELECT COUNT; executemany is not timed
+    assert series.count == 3
+
+
+def test_connection_execute_is_timed_once():
+    conn, series = connect(Registry())
+    conn.execute("SELECT 1").fetchall()
+    conn.close()
+    assert series.count == 1
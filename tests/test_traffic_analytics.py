@@ -0,0 +1,135 @@
+import numpy as np
+
+from traffic_analytics import AnomalyDetector, FlowCounter, QueueMonitor, SaturationFlowEstimator
+
+SAMPLE_RATE = 3  # samples per second, as a camera thread produces them
+
+
+def feed(detector: AnomalyDetector, start: float, seconds: float, values) -> list:
+    events = []
+    n = int(seconds * SAMPLE_RATE)
+    for i, value in enumerate(values(n)):
+        events += detector.update(start + i / SAMPLE_RATE, value)
+    return events
+
+
+def test_zero_flow_fires_after_sustained_zeros():
+    rng = np.random.default_rng(0)
+    detector = AnomalyDetector()
+    assert feed(detector, 0.0, 600, lambda n: rng.poisson(3, n)) == []
+
+    events = feed(detector, 600.0, 120, lambda n: np.zeros(n))
+    zero_flow = [e for e in events if e["kind"] == "zero_flow"]
+    assert len(zero_flow) == 1
+    assert zero_flow[0]["expected"] >= 2.5
+    assert 30 <= zero_flow[0]["score"] < 31
+
+
+def test_zero_flow_ignores_roads_that_are_usually_empty():
+    rng = np.random.default_rng(1)
+    detector = AnomalyDetector()
+    feed(detector, 0.0, 600, lambda n: (rng.random(n) < 0.1).astype(float))
+    events = feed(detector, 600.0, 120, lambda n: np.zeros(n))
+    assert not [e for e in events if e["kind"] == "zero_flow"]
+
+
+def test_approach_flow_counts_one_line_and_direction():
+    lines = [{"name": "main_approach", "p1": (0.0, 0.5), "p2": (1.0, 0.5)},
+             {"name": "side_street", "p1": (0.5, 0.0), "p2": (0.5, 1.0)}]
+    counter = FlowCounter(lines, ["car"], window_seconds=60)
+    down = counter.approach("main_approach", "reverse")
+    up = counter.approach("main_approach", "forward")
+    assert counter.approach("missing", "forward") is None
+
+    # Three vehicles cross the main line downwards, one upwards, two cross the side street
+    previous = np.array([[0.2, 0.4], [0.3, 0.4], [0.4, 0.4], [0.6, 0.6], [0.4, 0.2], [0.4, 0.8]])
+    current = np.array([[0.2, 0.6], [0.3, 0.6], [0.4, 0.6], [0.6, 0.4], [0.6, 0.2], [0.6, 0.8]])
+    counter.update(previous, current, np.zeros(6, dtype=np.int64), 100.0)
+
+    assert counter.approach_flow(down) == 3.0
+    assert counter.approach_flow(up) == 1.0
+    assert counter.total_flow() == 6.0
+
+
+def test_queue_dwell_survives_missed_frames():
+    monitor = QueueMonitor([{"name": "lane", "points": [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0)]}])
+    ids = np.array([7])
+    stopped = np.array([[0.5, 0.5]])
+    for t in range(0, 30):
+        state = monitor.update(ids, stopped, stopped, float(t))
+    assert state["waiting_time"] == 28.0
+
+    # Occluded for one frame, then seen again one frame interval later at its old position
+    monitor.update(np.empty(0, dtype=np.int64), np.empty((0, 2)), np.empty((0, 2)), 30.0)
+    state = monitor.update(ids, stopped, stopped, 31.0)
+    assert state["queue_length"] == 1
+    assert state["waiting_time"] == 30.0
+
+
+def test_queue_speed_uses_the_tracks_own_gap():
+    monitor = QueueMonitor([{"name": "lane", "points": [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0)]}])
+    ids = np.array([3])
+    monitor.update(ids, np.array([[0.5, 0.5]]), np.array([[0.5, 0.5]]), 0.0)
+    for t in range(1, 4):
+        monitor.update(np.empty(0, dtype=np.int64), np.empty((0, 2)), np.empty((0, 2)), float(t))
+
+    # 0.1 over the 4 s the track was missing is creeping, not the 0.1/s a one-frame dt would give
+    state = monitor.update(ids, np.array([[0.5, 0.5]]), np.array([[0.5, 0.6]]), 4.0)
+    assert state["queue_length"] == 1
+
+
+def test_incident_does_not_become_the_time_of_day_baseline():
+    rng = np.random.default_rng(2)
+    detector = AnomalyDetector()
+    detector.utc_offset = 0
+    normal = lambda n: rng.poisson(10, n)
+    # The same morning hour on three days builds the baseline for its four slots
+    for day in range(3):
+        assert not feed(detector, day * 86400 + 28800, 3600, normal)
+
+    # A 15-minute incident in the second slot of the fourth day is flagged while it lasts
+    start = 3 * 86400 + 28800
+    events = feed(detector, start, 900, normal)
+    events += feed(detector, start + 900, 900, lambda n: rng.poisson(14, n))
+    events += feed(detector, start + 1800, 1800, normal)
+    assert [e["kind"] for e in events] == ["sustained_high"]
+    incident_slot = (28800 + 900) // detector.slot_seconds
+    assert abs(detector.slot_mean[incident_slot] - 10) < 0.5
+
+    # Normal traffic in that slot the next day must not read as a drop against an absorbed incident
+    events = feed(detector, 4 * 86400 + 28800, 3600, normal)
+    assert not [e for e in events if e["kind"] == "sustained_low"]
+
+
+def test_saturation_flow_converges_on_the_discharge_headway():
+    rng = np.random.default_rng(3)
+    estimator = SaturationFlowEstimator(prior_headway=2.0)
+    now = 0.0
+    for cycle in range(20):
+        # Ten queued vehicles cross 2.5 s apart, then the queue runs out and a gap follows
+        for _ in range(10):
+            now += rng.normal(2.5, 0.2)
+            estimator.update(now, 1, True)
+        now += 40.0
+        estimator.update(now, 1, False)
+    assert abs(estimator.saturation_flow() - 1 / 2.5) < 0.01
+
+    # Free-flowing traffic that never queued must not pull the estimate
+    for _ in range(100):
+        now += 1.0
+        estimator.update(now, 1, False)
+    assert abs(estimator.saturation_flow() - 1 / 2.5) < 0.01
+
+
+def test_queue_reports_discharge_when_queued_vehicles_pull_away():
+    monitor = QueueMonitor([{"name": "lane", "points": [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0)]}])
+    ids = np.array([1, 2])
+    stopped = np.array([[0.5, 0.5], [0.5, 0.6]])
+    for t in range(5):
+        assert not monitor.update(ids, stopped, stopped, float(t))["discharging"]
+
+    moved = stopped + [[0.0, -0.2], [0.0, 0.0]]
+    assert monitor.update(ids, stopped, moved, 5.0)["discharging"]
+    for t in range(6, 12):
+        state = monitor.update(ids[1:], stopped[1:], stopped[1:], float(t))
+    assert not state["discharging"]
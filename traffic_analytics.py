@@ -0,0 +1,448 @@
+import time
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+# Direction labels for a counting line: "forward" crosses from the left of p1->p2 to its right
+DIRECTIONS = ("forward", "reverse")
+
+
+class CentroidTracker:
+    """Greedy nearest-centroid tracker in normalized (0-1) frame coordinates"""
+
+    def __init__(self, max_distance: float = 0.08, max_missed: int = 5):
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.next_id = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.positions = np.empty((0, 2), dtype=np.float64)
+        self.classes = np.empty(0, dtype=np.int64)
+        self.missed = np.empty(0, dtype=np.int64)
+
+    def update(self, centroids: np.ndarray, classes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Match detections to tracks; returns (track_ids, previous_positions, matched_mask)"""
+        n_det = len(centroids)
+        track_ids = np.empty(n_det, dtype=np.int64)
+        previous = np.full((n_det, 2), np.nan)
+        matched = np.zeros(n_det, dtype=bool)
+        track_used = np.zeros(len(self.ids), dtype=bool)
+
+        if n_det and len(self.ids):
+            dist = np.linalg.norm(self.positions[:, None, :] - centroids[None, :, :], axis=2)
+            order = np.argsort(dist, axis=None)
+            rows, cols = np.unravel_index(order, dist.shape)
+            for r, c in zip(rows, cols):
+                if dist[r, c] > self.max_distance:
+                    break
+                if track_used[r] or matched[c]:
+                    continue
+                track_used[r] = True
+                matched[c] = True
+                track_ids[c] = self.ids[r]
+                previous[c] = self.positions[r]
+
+        new = ~matched
+        n_new = int(new.sum())
+        track_ids[new] = np.arange(self.next_id, self.next_id + n_new)
+        self.next_id += n_new
+
+        # Keep unmatched tracks alive for a few frames so brief occlusions don't split them
+        missed = self.missed[~track_used] + 1
+        keep = missed <= self.max_missed
+        self.ids = np.concatenate([self.ids[~track_used][keep], track_ids])
+        self.positions = np.concatenate([self.positions[~track_used][keep], centroids])
+        self.classes = np.concatenate([self.classes[~track_used][keep], classes])
+        self.missed = np.concatenate([missed[keep], np.zeros(n_det, dtype=np.int64)])
+
+        return track_ids, previous, matched
+
+
+class FlowCounter:
+    """Counts track crossings over virtual lines and keeps sliding-window flow rates"""
+
+    def __init__(self, lines: List[Dict], class_names: List[str], window_seconds: int = 60):
+        self.line_names = [line["name"] for line in lines]
+        self.class_names = class_names
+        self.window_seconds = window_seconds
+        self.p1 = np.array([line["p1"] for line in lines], dtype=np.float64).reshape(-1, 2)
+        self.p2 = np.array([line["p2"] for line in lines], dtype=np.float64).reshape(-1, 2)
+        # One bin per second: (second, line, direction, class); running totals avoid re-summing the window
+        self.bins = np.zeros((window_seconds, len(lines), len(DIRECTIONS), len(class_names)), dtype=np.int32)
+        self.totals = np.zeros(self.bins.shape[1:], dtype=np.int64)
+        self.current_second = None
+
+    def _advance(self, now: float):
+        second = int(now)
+        if self.current_second is None:
+            self.current_second = second
+            return
+        elapsed = second - self.current_second
+        if elapsed <= 0:
+            return
+        for step in range(1, min(elapsed, self.window_seconds) + 1):
+            slot = (self.current_second + step) % self.window_seconds
+            self.totals -= self.bins[slot]
+            self.bins[slot] = 0
+        self.current_second = second
+
+    def update(self, previous: np.ndarray, current: np.ndarray, classes: np.ndarray, now: float) -> np.ndarray:
+        """Detect crossings of segments previous->current; returns (n_crossings, 3) of line, direction, class"""
+        self._advance(now)
+        if not len(self.line_names) or not len(current):
+            return np.empty((0, 3), dtype=np.int64)
+
+        valid = ~np.isnan(previous[:, 0])
+        a, b, cls = previous[valid], current[valid], classes[valid]
+        if not len(a):
+            return np.empty((0, 3), dtype=np.int64)
+
+        # Vectorized segment intersection: tracks (T) against lines (L)
+        line_vec = self.p2 - self.p1
+        side_a = _cross(line_vec[None, :, :], a[:, None, :] - self.p1[None, :, :])
+        side_b = _cross(line_vec[None, :, :], b[:, None, :] - self.p1[None, :, :])
+        move = b - a
+        end_1 = _cross(move[:, None, :], self.p1[None, :, :] - a[:, None, :])
+        end_2 = _cross(move[:, None, :], self.p2[None, :, :] - a[:, None, :])
+        hits = ((side_a >= 0) != (side_b >= 0)) & (end_1 * end_2 <= 0)
+
+        track_idx, line_idx = np.nonzero(hits)
+        direction = (side_b[track_idx, line_idx] >= 0).astype(np.int64)
+        crossings = np.stack([line_idx, direction, cls[track_idx]], axis=1)
+
+        slot = self.current_second % self.window_seconds
+        np.add.at(self.bins[slot], (line_idx, direction, cls[track_idx]), 1)
+        np.add.at(self.totals, (line_idx, direction, cls[track_idx]), 1)
+        return crossings
+
+    def total_flow(self) -> float:
+        """Vehicles per minute across all lines and directions"""
+        return float(self.totals.sum()) * 60.0 / self.window_seconds
+
+    def approach(self, line_name: str, direction: str) -> Optional[Tuple[int, int]]:
+        """(line, direction) indices of a named approach, or None if the camera has no such line"""
+        if line_name not in self.line_names:
+            return None
+        return self.line_names.index(line_name), DIRECTIONS.index(direction)
+
+    def approach_flow(self, approach: Tuple[int, int]) -> float:
+        """Vehicles per minute over one line in one direction"""
+        return float(self.totals[approach].sum()) * 60.0 / self.window_seconds
+
+    def flow_rates(self, now: Optional[float] = None) -> Dict:
+        """Vehicles per minute per line and direction, with a per-class breakdown"""
+        if now is not None:
+            self._advance(now)
+        per_minute = self.totals * (60.0 / self.window_seconds)
+        rates = {}
+        for li, line_name in enumerate(self.line_names):
+            rates[line_name] = {}
+            for di, direction in enumerate(DIRECTIONS):
+                by_class = per_minute[li, di]
+                rates[line_name][direction] = {
+                    "total_vpm": round(float(by_class.sum()), 2),
+                    "by_class": {name: round(float(v), 2) for name, v in zip(self.class_names, by_class)}
+                }
+        return rates
+
+
+def _cross(u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+
+class QueueMonitor:
+    """Queue length and dwell-based waiting time per lane polygon, using a precomputed raster label mask"""
+
+    def __init__(self, lanes: List[Dict], resolution: int = 256, stationary_speed: float = 0.05, max_missed: int = 5,
+                 discharge_seconds: float = 5.0):
+        self.lane_names = [lane["name"] for lane in lanes]
+        self.resolution = resolution
+        self.stationary_speed = stationary_speed
+        self.max_missed = max_missed
+        self.discharge_seconds = discharge_seconds
+        self.mask = rasterize_polygons([lane["points"] for lane in lanes], resolution)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.stationary_since = np.empty(0, dtype=np.float64)
+        self.last_seen = np.empty(0, dtype=np.float64)
+        self.missed = np.empty(0, dtype=np.int64)
+        self.last_time = None
+        # When a queued vehicle last started moving; the queue counts as discharging for discharge_seconds after
+        self.last_release = None
+
+    def lane_of(self, positions: np.ndarray) -> np.ndarray:
+        """Lane index for each normalized position (-1 outside all lanes)"""
+        cells = np.clip((positions * self.resolution).astype(np.int64), 0, self.resolution - 1)
+        return self.mask[cells[:, 1], cells[:, 0]]
+
+    def update(self, track_ids: np.ndarray, previous: np.ndarray, current: np.ndarray, now: float) -> Dict:
+        """Refresh dwell timers from this frame's tracks; returns per-lane queue length, mean wait and discharge state"""
+        last_frame = self.last_time if self.last_time is not None else now
+        self.last_time = now
+
+        # Look up remembered state, including tracks the tracker is still holding through a brief occlusion
+        order = np.argsort(self.ids)
+        sorted_ids = self.ids[order]
+        pos = np.clip(np.searchsorted(sorted_ids, track_ids), 0, max(len(sorted_ids) - 1, 0))
+        found = sorted_ids[pos] == track_ids if len(sorted_ids) else np.zeros(len(track_ids), dtype=bool)
+        prior = np.full(len(track_ids), np.nan)
+        seen = np.full(len(track_ids), last_frame)
+        prior[found] = self.stationary_since[order][pos[found]]
+        seen[found] = self.last_seen[order][pos[found]]
+
+        # A track reappearing after missed frames moved over its own gap, not just the last frame interval
+        elapsed = now - seen
+        speed = np.full(len(track_ids), np.inf)
+        np.divide(np.linalg.norm(current - previous, axis=1), elapsed, out=speed, where=elapsed > 0)
+        stationary = speed < self.stationary_speed
+        since = np.where(stationary, np.where(np.isnan(prior), now, prior), np.nan)
+
+        # Keep dwell timers for tracks missing from this frame for up to max_missed frames
+        absent = ~np.isin(self.ids, track_ids)
+        missed = self.missed[absent] + 1
+        keep = missed <= self.max_missed
+        self.ids = np.concatenate([self.ids[absent][keep], track_ids])
+        self.stationary_since = np.concatenate([self.stationary_since[absent][keep], since])
+        self.last_seen = np.concatenate([self.last_seen[absent][keep], np.full(len(track_ids), now)])
+        self.missed = np.concatenate([missed[keep], np.zeros(len(track_ids), dtype=np.int64)])
+
+        lanes = self.lane_of(current) if len(current) else np.empty(0, dtype=np.int64)
+        queued = stationary & (lanes >= 0)
+        released = ~np.isnan(prior) & ~stationary & (lanes >= 0)
+        if released.any():
+            self.last_release = now
+        dwell = now - since[queued]
+        n_lanes = len(self.lane_names)
+        queue_lengths = np.bincount(lanes[queued], minlength=n_lanes)
+        dwell_sums = np.bincount(lanes[queued], weights=dwell, minlength=n_lanes)
+
+        return {
+            "lanes": {
+                name: {
+                    "queue_length": int(queue_lengths[i]),
+                    "waiting_time": round(float(dwell_sums[i] / queue_lengths[i]), 1) if queue_lengths[i] else 0.0
+                } for i, name in enumerate(self.lane_names)
+            },
+            "queue_length": int(queued.sum()),
+            "waiting_time": float(dwell.mean()) if len(dwell) else 0.0,
+            "discharging": self.last_release is not None and now - self.last_release <= self.discharge_seconds
+        }
+
+
+def rasterize_polygons(polygons: List[List[Tuple[float, float]]], resolution: int) -> np.ndarray:
+    """Label grid where each cell holds the index of the first polygon containing its center, or -1"""
+    ys, xs = (np.mgrid[0:resolution, 0:resolution] + 0.5) / resolution
+    mask = np.full((resolution, resolution), -1, dtype=np.int16)
+    for label, points in enumerate(polygons):
+        inside = np.zeros(mask.shape, dtype=bool)
+        for (xi, yi), (xj, yj) in zip(points, points[-1:] + points[:-1]):
+            if yi == yj:
+                continue
+            # Even-odd rule: toggle cells whose rightward ray crosses this edge
+            spans = (yi > ys) != (yj > ys)
+            inside ^= spans & (xs < (xj - xi) * (ys - yi) / (yj - yi) + xi)
+        mask[inside & (mask < 0)] = label
+    return mask
+
+
+class AnomalyDetector:
+    """O(1)-per-sample detector for spikes, drops to zero and sustained deviation from the time-of-day baseline"""
+
+    def __init__(self, alpha: float = 0.02, deviation_alpha: float = 0.01, spike_z: float = 5.0,
+                 zero_seconds: float = 30.0, slot_seconds: int = 900, slot_alpha: float = 0.1,
+                 cusum_k: float = 1.0, cusum_h: float = 10.0, warmup: int = 60, slot_warmup: int = 3,
+                 min_scale: float = 1.0):
+        self.alpha = alpha
+        self.deviation_alpha = deviation_alpha
+        self.spike_z = spike_z
+        self.zero_seconds = zero_seconds
+        self.slot_seconds = slot_seconds
+        self.slot_alpha = slot_alpha
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.warmup = warmup
+        self.slot_warmup = slot_warmup
+        self.min_scale = min_scale
+        self.utc_offset = -time.timezone
+        self.mean = 0.0
+        self.deviation = 0.0
+        self.samples = 0
+        self.in_spike = False
+        self.zero_since = None
+        # Baseline mean when the current zero run began; the EWMA itself decays towards zero during the run
+        self.zero_baseline = 0.0
+        self.zero_reported = False
+        # Time-of-day baseline: per-day EWMA of each slot's mean and deviation, and how many days it has seen
+        n_slots = 86400 // slot_seconds
+        self.slot_mean = np.zeros(n_slots)
+        self.slot_deviation = np.zeros(n_slots)
+        self.slot_days = np.zeros(n_slots, dtype=np.int64)
+        # Running sums for the slot being observed now, folded into the baseline when it closes
+        self.open_slot = None
+        self.slot_count = 0
+        self.slot_sum = 0.0
+        self.slot_sum_sq = 0.0
+        self.slot_disturbed = False
+        self.cusum_high = 0.0
+        self.cusum_low = 0.0
+        self.shift = 0
+
+    def _scale(self, deviation: float) -> float:
+        # 1.2533 * mean absolute deviation estimates the standard deviation for normal data
+        return max(1.2533 * deviation, self.min_scale)
+
+    def _close_slot(self):
+        """Fold the finished slot into its time-of-day baseline, unless a shift was flagged during it"""
+        if self.slot_count and not self.slot_disturbed:
+            slot = self.open_slot % len(self.slot_mean)
+            mean = self.slot_sum / self.slot_count
+            # Stored in mean-absolute-deviation units so _scale() treats it like the per-sample deviation
+            deviation = max(self.slot_sum_sq / self.slot_count - mean * mean, 0.0) ** 0.5 / 1.2533
+            weight = max(self.slot_alpha, 1.0 / (self.slot_days[slot] + 1))
+            self.slot_mean[slot] += weight * (mean - self.slot_mean[slot])
+            self.slot_deviation[slot] += weight * (deviation - self.slot_deviation[slot])
+            self.slot_days[slot] += 1
+        self.slot_count = 0
+        self.slot_sum = 0.0
+        self.slot_sum_sq = 0.0
+        self.slot_disturbed = False
+
+    def update(self, ts: float, value: float) -> List[Dict]:
+        """Feed one sample; returns any anomaly events it triggers"""
+        events = []
+        value = float(value)
+        baseline = self.mean
+
+        if self.samples:
+            scale = self._scale(self.deviation)
+            z = (value - self.mean) / scale
+            if self.samples >= self.warmup:
+                spiking = abs(z) >= self.spike_z
+                if spiking and not self.in_spike:
+                    events.append(_anomaly("spike" if z > 0 else "dip", ts, value, self.mean, z))
+                self.in_spike = spiking
+            # Winsorize the residual so one outlier cannot drag the baseline with it
+            residual = max(-self.spike_z * scale, min(self.spike_z * scale, value - self.mean))
+            # Plain running averages until the EWMA has enough history to be trusted
+            weight = 1.0 / (self.samples + 1)
+            self.mean += max(self.alpha, weight) * residual
+            self.deviation += max(self.deviation_alpha, weight) * (abs(residual) - self.deviation)
+        else:
+            self.mean = value
+        self.samples += 1
+
+        if value <= 0:
+            if self.zero_since is None:
+                self.zero_since = ts
+                self.zero_baseline = baseline
+            elif (not self.zero_reported and ts - self.zero_since >= self.zero_seconds
+                  and self.samples >= self.warmup and self.zero_baseline >= self.min_scale):
+                events.append(_anomaly("zero_flow", ts, value, self.zero_baseline, ts - self.zero_since))
+                self.zero_reported = True
+        else:
+            self.zero_since = None
+            self.zero_reported = False
+
+        day_slot = int((ts + self.utc_offset) // self.slot_seconds)
+        if day_slot != self.open_slot:
+            self._close_slot()
+            self.open_slot = day_slot
+        slot = day_slot % len(self.slot_mean)
+        if self.slot_days[slot] >= self.slot_warmup:
+            expected = self.slot_mean[slot]
+            # Clipped so a single spike cannot trip the CUSUM on its own
+            z_slot = max(-3.0, min(3.0, (value - expected) / self._scale(self.slot_deviation[slot])))
+            # Two-sided CUSUM catches small shifts that persist, which the spike test misses; capped so
+            # that a long incident clears soon after traffic returns to normal
+            limit = 2 * self.cusum_h
+            self.cusum_high = min(limit, max(0.0, self.cusum_high + z_slot - self.cusum_k))
+            self.cusum_low = min(limit, max(0.0, self.cusum_low - z_slot - self.cusum_k))
+            if self.cusum_high >= self.cusum_h and self.shift <= 0:
+                events.append(_anomaly("sustained_high", ts, value, expected, self.cusum_high))
+                self.shift = 1
+            elif self.cusum_low >= self.cusum_h and self.shift >= 0:
+                events.append(_anomaly("sustained_low", ts, value, expected, self.cusum_low))
+                self.shift = -1
+            elif self.cusum_high == 0.0 and self.cusum_low == 0.0:
+                self.shift = 0
+
+        # A slot that saw a flagged shift is left out of the baseline, so an incident never becomes the norm
+        self.slot_disturbed = self.slot_disturbed or self.shift != 0
+        self.slot_count += 1
+        self.slot_sum += value
+        self.slot_sum_sq += value * value
+
+        return events
+
+
+def _anomaly(kind: str, ts: float, value: float, expected: float, score: float) -> Dict:
+    return {"kind": kind, "timestamp": ts, "value": round(value, 2), "expected": round(float(expected), 2),
+            "score": round(float(score), 2)}
+
+
+class SaturationFlowEstimator:
+    """Saturation flow learned from discharge headways: gaps between stop-line crossings while a queue discharges"""
+
+    def __init__(self, prior_headway: float = 2.0, alpha: float = 0.05,
+                 min_headway: float = 0.8, max_headway: float = 5.0):
+        self.headway = prior_headway
+        self.alpha = alpha
+        self.min_headway = min_headway
+        self.max_headway = max_headway
+        self.samples = 0
+        self.last_crossing = None
+
+    def update(self, now: float, crossings: int, discharging: bool):
+        """Fold in this frame's crossing count; only back-to-back crossings from a discharging queue count"""
+        if not crossings:
+            return
+        if discharging and self.last_crossing is not None:
+            headway = (now - self.last_crossing) / crossings
+            # Longer gaps mean the queue ran out rather than a slower discharge
+            if self.min_headway <= headway <= self.max_headway:
+                self.headway += self.alpha * (headway - self.headway)
+                self.samples += 1
+        self.last_crossing = now if discharging else None
+
+    def saturation_flow(self) -> float:
+        """Vehicles per second a queued approach discharges at"""
+        return 1.0 / self.headway
+
+
+class HoltForecaster:
+    """Damped Holt (level + trend) forecasters for many series at once, with O(1) state per series"""
+
+    def __init__(self, n_series: int, horizons: Tuple[int, ...] = (30, 60, 90, 120),
+                 alpha: float = 0.2, beta: float = 0.05, phi: float = 0.995):
+        self.horizons = np.asarray(horizons, dtype=np.float64)
+        self.alpha = alpha
+        self.beta = beta
+        self.phi = phi
+        self.level = np.zeros(n_series)
+        self.trend = np.zeros(n_series)  # per second
+        self.last_ts = np.full(n_series, np.nan)
+        # sum_{k=1..h} phi^k: how much of the current trend survives damping over each horizon
+        self.damped_steps = phi * (1 - phi ** self.horizons) / (1 - phi)
+
+    def update(self, idx: int, ts: float, value: float):
+        """Fold one irregularly spaced sample into series idx"""
+        last_ts = self.last_ts[idx]
+        if np.isnan(last_ts):
+            self.level[idx] = value
+            self.last_ts[idx] = ts
+            return
+        dt = ts - last_ts
+        if dt <= 0:
+            return
+        level, trend = self.level[idx], self.trend[idx]
+        damping = self.phi ** dt
+        predicted = level + trend * self.phi * (1 - damping) / (1 - self.phi)
+        new_level = predicted + self.alpha * (value - predicted)
+        self.trend[idx] = self.beta * (new_level - level) / dt + (1 - self.beta) * trend * damping
+        self.level[idx] = new_level
+        self.last_ts[idx] = ts
+
+    def forecast(self, idx: int) -> np.ndarray:
+        """Predicted value at each horizon for series idx, never below zero"""
+        return np.maximum(self.level[idx] + self.trend[idx] * self.damped_steps, 0.0)
+
+    def forecast_all(self) -> np.ndarray:
+        """(n_series, n_horizons) forecasts for every series in one vectorized pass"""
+        return np.maximum(self.level[:, None] + self.trend[:, None] * self.damped_steps[None, :], 0.0)
@@ -0,0 +1,140 @@
+import heapq
+import numpy as np
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+# Signal events; at equal times a phase change is handled before a departure
+GREEN_START, RED_START, DEPARTURE = 0, 1, 2
+
+SATURATION_HEADWAY = 2.0  # seconds between queued vehicles discharging on green
+STARTUP_LOST_TIME = 2.0  # seconds before the first queued vehicle moves once green starts
+IDLE_CO2_KG_PER_SECOND = 0.00039  # idling car; other classes scale by their emission factor
+POLICY_HISTORY = 10  # queued PCU at previous green starts, passed to policies as traffic history
+
+# A policy gets the junction state at the start of each green and returns the green time in seconds
+SignalPolicy = Callable[[Dict], float]
+
+
+def generate_arrivals(rates_vpm: np.ndarray, bucket_seconds: float, class_mix: np.ndarray,
+                      rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """Poisson arrival times and classes from per-bucket recorded flow rates (vehicles per minute)"""
+    rates = np.nan_to_num(np.asarray(rates_vpm, dtype=np.float64)).clip(min=0)
+    counts = rng.poisson(rates * bucket_seconds / 60.0)
+    times = np.repeat(np.arange(len(counts)) * bucket_seconds, counts) + rng.uniform(0, bucket_seconds, counts.sum())
+    times.sort()
+    mix = np.asarray(class_mix, dtype=np.float64)
+    classes = rng.choice(len(mix), size=len(times), p=mix / mix.sum())
+    return times, classes
+
+
+def simulate(arrival_times: np.ndarray, arrival_classes: np.ndarray, policy: SignalPolicy, red_time: float,
+             pcu_factors: np.ndarray, emission_factors: np.ndarray, duration: Optional[float] = None,
+             saturation_headway: float = SATURATION_HEADWAY) -> Dict:
+    """Run one approach through alternating green/red phases with a heap-ordered event schedule
+
+    Arrivals are consumed in time order alongside the heap, so it only ever holds the next phase
+    change and the next departure.
+    """
+    duration = duration if duration is not None else (float(arrival_times[-1]) if len(arrival_times) else 0.0)
+    pcu_factors = np.asarray(pcu_factors, dtype=np.float64)
+    # Idle emissions relative to a car, indexed by class
+    co2_rates = IDLE_CO2_KG_PER_SECOND * np.asarray(emission_factors, dtype=np.float64) / emission_factors[0]
+
+    events = [(0.0, GREEN_START)]
+    waiting = deque()  # (arrival_time, class) in arrival order
+    queued_pcu = 0.0
+    green = False
+    departure_pending = False
+    next_free = 0.0  # earliest time the stop line can discharge another vehicle
+    history = deque(maxlen=POLICY_HISTORY)
+
+    delays = np.zeros(len(arrival_times))
+    served = 0
+    co2 = 0.0
+    queue_area = 0.0
+    max_queue = 0
+    greens = []
+    last_time = 0.0
+    i = 0
+    n = len(arrival_times)
+
+    while True:
+        next_arrival = arrival_times[i] if i < n else np.inf
+        next_event = events[0][0] if events else np.inf
+        now = min(next_arrival, next_event)
+        if now > duration:
+            break
+        queue_area += len(waiting) * (now - last_time)
+        last_time = now
+
+        if next_arrival <= next_event:
+            cls = arrival_classes[i]
+            if green and not waiting and now >= next_free:
+                # Nothing queued: the vehicle crosses without stopping
+                next_free = now + saturation_headway
+                served += 1
+            else:
+                waiting.append((now, cls))
+                queued_pcu += pcu_factors[cls]
+                max_queue = max(max_queue, len(waiting))
+                if green and not departure_pending:
+                    heapq.heappush(events, (max(now, next_free), DEPARTURE))
+                    departure_pending = True
+            i += 1
+            continue
+
+        _, kind = heapq.heappop(events)
+        if kind == GREEN_START:
+            green = True
+            state = {
+                "time": now,
+                "queue_length": len(waiting),
+                "queued_pcu": queued_pcu,
+                "waiting_time": now - waiting[0][0] if waiting else 0.0,
+                "history": list(history)
+            }
+            green_time = float(policy(state))
+            history.append(queued_pcu)
+            greens.append(green_time)
+            heapq.heappush(events, (now + green_time, RED_START))
+            next_free = max(next_free, now + STARTUP_LOST_TIME)
+            if waiting and not departure_pending:
+                heapq.heappush(events, (next_free, DEPARTURE))
+                departure_pending = True
+        elif kind == RED_START:
+            green = False
+            heapq.heappush(events, (now + red_time, GREEN_START))
+        else:
+            departure_pending = False
+            if not green or not waiting:
+                continue
+            arrived, cls = waiting.popleft()
+            queued_pcu -= pcu_factors[cls]
+            delays[served] = now - arrived
+            co2 += (now - arrived) * co2_rates[cls]
+            served += 1
+            next_free = now + saturation_headway
+            if waiting:
+                heapq.heappush(events, (next_free, DEPARTURE))
+                departure_pending = True
+
+    # Vehicles still queued at the end count with the delay accrued so far
+    for arrived, cls in waiting:
+        delays[served] = duration - arrived
+        co2 += (duration - arrived) * co2_rates[cls]
+        served += 1
+    delays = delays[:served]
+    queue_area += len(waiting) * max(duration - last_time, 0.0)
+
+    return {
+        "simulated_seconds": duration,
+        "vehicles": int(served),
+        "cycles": len(greens),
+        "average_delay": round(float(delays.mean()), 2) if served else 0.0,
+        "p95_delay": round(float(np.percentile(delays, 95)), 2) if served else 0.0,
+        "total_delay_hours": round(float(delays.sum()) / 3600, 2),
+        "average_queue": round(float(queue_area / duration), 2) if duration else 0.0,
+        "max_queue": int(max_queue),
+        "average_green": round(float(np.mean(greens)), 1) if greens else 0.0,
+        "idle_co2_kg": round(float(co2), 2)
+    }